@@ -0,0 +1,248 @@
+"""
+Typeahead autocomplete for personnel, organizations and locations.
+
+Each (kind, company scope) gets an in-process index of its names: sorted
+lists of whole labels and of later word starts for prefix matches, and a
+trigram map for typo-tolerant matches ("jonh" still finds "John Smith"). A lookup is a bisect plus a short
+scan, well under a millisecond, so pickers can query per keystroke instead of
+prefetching whole lists.
+
+Indexes are stamped with the table versions from cache.py, which live in the
+cache_versions table (or Redis) that all workers share. Every commit bumps the
+versions of the tables it wrote there, so each worker's next lookup after a
+write, whichever worker made it, reads a newer version and rebuilds that one
+tenant's index. Reading the versions is one small query per request. Indexes
+for every company can be warmed at startup with warm_autocomplete().
+"""
+
+import os
+import re
+import threading
+from bisect import bisect_left
+
+from sqlalchemy import select
+
+from cache import LRUCache, table_versions, ALL_COMPANIES
+from models import Company, Organization, Personnel, Project, Events
+
+
+# Autocomplete configuration
+AUTOCOMPLETE_CONFIG = {
+    'default_limit': 10,
+    'max_limit': 50,
+    'max_indexes': int(os.getenv('RELAY_AUTOCOMPLETE_MAX_INDEXES', '256')),  # (kind, company) indexes kept
+    'min_similarity': 0.3,  # Trigram similarity for fuzzy matches, as pg_trgm's default
+    'warm': os.getenv('RELAY_AUTOCOMPLETE_WARM', '1') == '1',
+}
+
+_WORD = re.compile(r'\w+')
+
+
+def normalize(value):
+    return ' '.join(_WORD.findall(value.lower()))
+
+
+def trigrams(value):
+    """pg_trgm-style trigrams: each word padded with two leading spaces and one trailing"""
+    grams = set()
+    for word in value.split():
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class TypeaheadIndex:
+    """Prefix and trigram lookups over a fixed list of suggestions"""
+
+    def __init__(self, suggestions):
+        self.suggestions = suggestions  # [{'label': ..., ...}]
+        self._normalized = [normalize(s['label']) for s in suggestions]
+        # Whole labels, plus a key per later word start so "smi" finds "John Smith".
+        # Kept apart so whole-label matches are always scanned first.
+        labels, word_keys = [], []
+        self._trigrams = {}
+        self._trigram_counts = []
+        for position, text in enumerate(self._normalized):
+            labels.append((text, position))
+            words = text.split()
+            for start in range(1, len(words)):
+                word_keys.append((' '.join(words[start:]), position))
+            grams = trigrams(text)
+            self._trigram_counts.append(len(grams))
+            for gram in grams:
+                self._trigrams.setdefault(gram, []).append(position)
+        labels.sort()
+        word_keys.sort()
+        self._label_keys = [key for key, _ in labels]
+        self._label_positions = [position for _, position in labels]
+        self._word_keys = [key for key, _ in word_keys]
+        self._word_positions = [position for _, position in word_keys]
+
+    @staticmethod
+    def _scan(keys, positions, prefix, matches, seen, cap):
+        index = bisect_left(keys, prefix)
+        while index < len(keys) and keys[index].startswith(prefix) and len(matches) < cap:
+            position = positions[index]
+            if position not in seen:
+                seen.add(position)
+                matches.append(position)
+            index += 1
+
+    def _rank(self, position):
+        return len(self._normalized[position]), self._normalized[position]
+
+    def _prefix_matches(self, prefix, limit):
+        # Scan a little past `limit` so the ranking can prefer shorter labels
+        cap = limit * 4
+        label_matches, seen = [], set()
+        self._scan(self._label_keys, self._label_positions, prefix, label_matches, seen, cap)
+        label_matches.sort(key=self._rank)
+        if len(label_matches) >= limit:
+            return label_matches[:limit]
+        word_matches = []
+        self._scan(self._word_keys, self._word_positions, prefix, word_matches, seen, cap)
+        word_matches.sort(key=self._rank)
+        return (label_matches + word_matches)[:limit]
+
+    def _fuzzy_matches(self, text, limit, exclude):
+        query = trigrams(text)
+        if not query:
+            return []
+        shared = {}
+        for gram in query:
+            for position in self._trigrams.get(gram, ()):
+                if position not in exclude:
+                    shared[position] = shared.get(position, 0) + 1
+        scored = []
+        for position, count in shared.items():
+            similarity = count / (len(query) + self._trigram_counts[position] - count)
+            if similarity >= AUTOCOMPLETE_CONFIG['min_similarity']:
+                scored.append((-similarity, self._normalized[position], position))
+        scored.sort()
+        return [position for _, _, position in scored[:limit]]
+
+    def lookup(self, text, limit):
+        """Top `limit` suggestions: prefix matches first, then trigram matches"""
+        text = normalize(text)
+        if not text:
+            return []
+        positions = self._prefix_matches(text, limit)
+        if len(positions) < limit and len(text) >= 3:
+            positions += self._fuzzy_matches(text, limit - len(positions), set(positions))
+        return [self.suggestions[position] for position in positions]
+
+
+# Suggestion sources: tables read (for invalidation) and a loader per company scope
+
+def _company_filter(statement, column, scope):
+    return statement if scope == ALL_COMPANIES else statement.where(column == scope)
+
+
+def _load_personnel(session, scope):
+    statement = _company_filter(
+        select(Personnel.id, Personnel.name, Personnel.role).where(Personnel.name.isnot(None)),
+        Personnel.company_id, scope,
+    )
+    return [{'id': id, 'label': name, 'role': role} for id, name, role in session.execute(statement)]
+
+
+def _load_organizations(session, scope):
+    statement = _company_filter(
+        select(Organization.id, Organization.name).where(Organization.name.isnot(None)),
+        Organization.company_id, scope,
+    )
+    return [{'id': id, 'label': name} for id, name in session.execute(statement)]
+
+
+def _load_locations(session, scope):
+    event_locations = _company_filter(
+        select(Events.location).where(Events.location.isnot(None)).distinct(), Events.company_id, scope,
+    )
+    project_locations = _company_filter(
+        select(Project.location).join(Organization, Organization.id == Project.organization_id)
+        .where(Project.location.isnot(None)).distinct(),
+        Organization.company_id, scope,
+    )
+    locations = {}
+    for statement in (event_locations, project_locations):
+        for (location,) in session.execute(statement):
+            # One suggestion per spelling that differs only in case or punctuation
+            locations.setdefault(normalize(location), location)
+    return [{'label': location} for key, location in sorted(locations.items()) if key]
+
+
+AUTOCOMPLETE_SOURCES = {
+    'personnel': (('personnels',), _load_personnel),
+    'organizations': (('organizations',), _load_organizations),
+    'locations': (('events', 'projects', 'organizations'), _load_locations),
+}
+
+
+class _IndexSlot:
+    """LRU entry for one (kind, scope): its rebuild lock and its current (versions, index)"""
+
+    __slots__ = ('lock', 'current')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.current = None
+
+
+class AutocompleteIndexes:
+    """Index per (kind, company scope), rebuilt when its tables' shared versions move"""
+
+    def __init__(self, max_indexes=256):
+        self._indexes = LRUCache(max_indexes)
+        self._slots_lock = threading.Lock()
+
+    def _slot(self, key):
+        # Each lock lives in its LRU slot, so evicting an index drops its lock too
+        with self._slots_lock:
+            slot = self._indexes.get(key)
+            if slot is None:
+                slot = _IndexSlot()
+                self._indexes.set(key, slot)
+            return slot
+
+    def get(self, session, kind, scope):
+        tables, loader = AUTOCOMPLETE_SOURCES[kind]
+        versions = table_versions.scope_versions(tables, scope)
+        slot = self._slot((kind, scope))
+        current = slot.current
+        if current is not None and current[0] == versions:
+            return current[1]
+        # One rebuild per index at a time; concurrent lookups wait for it
+        with slot.lock:
+            current = slot.current
+            if current is not None and current[0] == versions:
+                return current[1]
+            index = TypeaheadIndex(loader(session, scope))
+            slot.current = (versions, index)
+            return index
+
+
+autocomplete_indexes = AutocompleteIndexes(AUTOCOMPLETE_CONFIG['max_indexes'])
+
+
+def warm_autocomplete(session_factory):
+    """Build every company's indexes (run in a background thread at startup)"""
+    session = session_factory()
+    try:
+        # No more companies than the LRU can hold, or warming would evict its own indexes
+        company_ids = session.execute(
+            select(Company.id).order_by(Company.id).limit(AUTOCOMPLETE_CONFIG['max_indexes'] // len(AUTOCOMPLETE_SOURCES))
+        ).scalars().all()
+        for scope in company_ids:
+            for kind in AUTOCOMPLETE_SOURCES:
+                autocomplete_indexes.get(session, kind, scope)
+        print(f"Autocomplete warmed for {len(company_ids)} companies")
+    except Exception as e:
+        print(f"Autocomplete warm-up failed: {e}")
+    finally:
+        session.close()
+
+
+def start_autocomplete_warmup(session_factory):
+    if AUTOCOMPLETE_CONFIG['warm']:
+        threading.Thread(target=warm_autocomplete, args=(session_factory,), name='autocomplete-warmup',
+                         daemon=True).start()
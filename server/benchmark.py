@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Endpoint benchmarks against a seeded database.
+
+Boots the Flask app in-process and drives every route registered with
+api.add_resource (GET, with ids filled in from the database) plus
+/api/upload-images, from a pool of client threads. For each route it reports
+p50/p95/p99 latency, throughput, SQL statements per request, response bytes
+and the response cache hit rate, and saves the run as JSON:
+
+    python seed.py --reset --scale medium
+    python benchmark.py --requests 200 --concurrency 8 --output bench/before.json
+    ... change something ...
+    python benchmark.py --requests 200 --concurrency 8 --output bench/after.json --compare bench/before.json
+
+Requests are made as a seeded company admin (admin@company<N>.test) unless
+--email is given, so tenant scoping is part of what gets measured. The upload
+scenario writes image files and rows; skip it with --skip-writes.
+"""
+
+import argparse
+import io
+import json
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from flask_restful import Resource
+from PIL import Image as PILImage
+from sqlalchemy import event, text
+
+import main
+
+
+# Table holding the ids for each URL parameter
+ROUTE_PARAMETERS = {
+    'user_id': 'users',
+    'project_id': 'projects',
+    'event_id': 'events',
+    'personnel_id': 'personnels',
+    'shot_request_id': 'shot_requests',
+    'image_id': 'images',
+    'org_id': 'organizations',
+    'company_id': 'companies',
+    'request_id': 'access_requests',
+    'email_id': 'email_outbox',
+}
+
+
+# SQL statement counting, per request thread
+
+_counter = threading.local()
+
+
+@event.listens_for(main.engine, 'before_cursor_execute')
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    _counter.statements = getattr(_counter, 'statements', 0) + 1
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def sample_ids(company_id):
+    """One existing id per route parameter, preferring rows of the benchmark company"""
+    ids = {}
+    with main.engine.connect() as conn:
+        for parameter, table in ROUTE_PARAMETERS.items():
+            if table == 'companies':
+                ids[parameter] = company_id
+                continue
+            scoped = company_id is not None and table in ('users', 'personnels', 'organizations', 'events',
+                                                          'shot_requests', 'images')
+            where = "WHERE company_id = :company_id" if scoped else ""
+            ids[parameter] = conn.execute(
+                text(f"SELECT MIN(id) FROM {table} {where}"), {'company_id': company_id}
+            ).scalar()
+        if company_id is not None:
+            ids['project_id'] = conn.execute(text(
+                "SELECT MIN(p.id) FROM projects p JOIN organizations o ON o.id = p.organization_id "
+                "WHERE o.company_id = :company_id"
+            ), {'company_id': company_id}).scalar()
+    return ids
+
+
+def get_scenarios(ids):
+    """(name, request kwargs) for every GET route registered through api.add_resource"""
+    scenarios = []
+    for rule in main.app.url_map.iter_rules():
+        view_class = getattr(main.app.view_functions[rule.endpoint], 'view_class', None)
+        if not (view_class and issubclass(view_class, Resource)) or 'GET' not in rule.methods:
+            continue
+        values = {argument: ids.get(argument) for argument in rule.arguments}
+        if any(value is None for value in values.values()):
+            print(f"Skipping {rule.rule}: no row to request")
+            continue
+        path = main.app.url_map.bind('localhost').build(rule.endpoint, values)
+        scenarios.append((f'GET {rule.rule}', {'method': 'GET', 'path': path}))
+    return sorted(scenarios)
+
+
+def upload_scenario(ids):
+    buffer = io.BytesIO()
+    PILImage.new('RGB', (1600, 1067), (90, 120, 160)).save(buffer, 'JPEG', quality=85)
+    image_bytes = buffer.getvalue()
+
+    def body():
+        # A fresh stream per request: the test client consumes it
+        return {'event_id': str(ids['event_id']), 'images': (io.BytesIO(image_bytes), 'bench.jpg')}
+
+    return ('POST /api/upload-images', {'method': 'POST', 'path': '/api/upload-images', 'data': body})
+
+
+def run_scenario(request_kwargs, headers, requests, concurrency):
+    """Issue `requests` calls over `concurrency` threads; returns the measurements"""
+    local = threading.local()
+
+    def one(_):
+        if not hasattr(local, 'client'):
+            local.client = main.app.test_client()
+        kwargs = dict(request_kwargs)
+        if callable(kwargs.get('data')):
+            kwargs['data'] = kwargs['data']()
+        _counter.statements = 0
+        started = time.perf_counter()
+        response = local.client.open(kwargs.pop('path'), headers=headers, **kwargs)
+        elapsed = time.perf_counter() - started
+        return elapsed, response.status_code, len(response.get_data()), _counter.statements, \
+            response.headers.get('X-Cache')
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        samples = list(pool.map(one, range(requests)))
+    wall = time.perf_counter() - started
+    if not samples:
+        return {'requests': 0}  # e.g. --warmup 0
+
+    latencies = sorted(sample[0] * 1000 for sample in samples)
+    cache_results = [sample[4] for sample in samples if sample[4]]
+    return {
+        'requests': requests,
+        'errors': sum(1 for sample in samples if sample[1] >= 400),
+        'status_codes': sorted({sample[1] for sample in samples}),
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'mean_ms': round(sum(latencies) / len(latencies), 2),
+        'throughput_rps': round(requests / wall, 1),
+        'sql_per_request': round(sum(sample[3] for sample in samples) / requests, 1),
+        'bytes_per_response': round(sum(sample[2] for sample in samples) / requests),
+        'cache_hit_rate': round(cache_results.count('HIT') / len(cache_results), 2) if cache_results else None,
+    }
+
+
+def login(email, password):
+    response = main.app.test_client().post('/api/login', json={'email': email, 'password': password})
+    if response.status_code != 200:
+        raise SystemExit(f"Login as {email} failed: {response.get_json()}")
+    payload = response.get_json()
+    user = payload.get('user') or {}
+    # Super admins are unscoped: sample ids from any company
+    return payload.get('token'), None if user.get('is_super_admin') else user.get('company_id')
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    """Print p50/p95 and SQL count changes against an earlier run"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)['results']
+    print(f"\n{'route':<55} {'p50 ms':>16} {'p95 ms':>16} {'sql/req':>12}")
+    for name, current in results.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        cells = []
+        for key in ('p50_ms', 'p95_ms', 'sql_per_request'):
+            change = (current[key] - before[key]) / before[key] * 100 if before[key] else 0
+            cells.append(f"{before[key]}→{current[key]} ({change:+.0f}%)")
+        print(f"{name:<55} {cells[0]:>16} {cells[1]:>16} {cells[2]:>12}")
+
+
+def count_arg(minimum):
+    """argparse type for an int of at least `minimum`"""
+    def parse(value):
+        number = int(value)
+        if number < minimum:
+            raise argparse.ArgumentTypeError(f'must be at least {minimum}')
+        return number
+    return parse
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description='Benchmark the Relay API against the configured database')
+    parser.add_argument('--requests', type=count_arg(1), default=100, help='Requests per route')
+    parser.add_argument('--concurrency', type=count_arg(1), default=4)
+    parser.add_argument('--warmup', type=count_arg(0), default=5, help='Unmeasured requests per route first')
+    parser.add_argument('--email', default=None, help='Login to benchmark as (default: first seeded company admin)')
+    parser.add_argument('--password', default='password123')
+    parser.add_argument('--routes', default=None, help='Only routes containing this text')
+    parser.add_argument('--skip-writes', action='store_true', help='Leave out /api/upload-images')
+    parser.add_argument('--output', default=None, help='JSON results file (default: bench/<commit>-<time>.json)')
+    parser.add_argument('--compare', default=None, help='Earlier results file to diff against')
+    args = parser.parse_args()
+
+    email = args.email
+    if email is None:
+        with main.engine.connect() as conn:
+            email = conn.execute(text(
+                "SELECT email FROM users WHERE email LIKE 'admin@company%.test' ORDER BY id LIMIT 1"
+            )).scalar() or 'admin@relay.com'
+    token, company_id = login(email, args.password)
+    headers = {'Authorization': f'Bearer {token}'} if token else {}
+
+    ids = sample_ids(company_id)
+    scenarios = get_scenarios(ids)
+    if not args.skip_writes and ids.get('event_id') is not None:
+        scenarios.append(upload_scenario(ids))
+    if args.routes:
+        scenarios = [scenario for scenario in scenarios if args.routes in scenario[0]]
+
+    results = {}
+    for name, request_kwargs in scenarios:
+        run_scenario(request_kwargs, headers, args.warmup, 1)
+        results[name] = run_scenario(request_kwargs, headers, args.requests, args.concurrency)
+        r = results[name]
+        print(f"{name:<55} p50 {r['p50_ms']:>8} p95 {r['p95_ms']:>8} p99 {r['p99_ms']:>8} ms "
+              f"{r['throughput_rps']:>7} req/s {r['sql_per_request']:>6} sql {r['bytes_per_response']:>9} B")
+
+    commit = git_commit()
+    output = args.output or os.path.join('bench', f"{commit or 'unknown'}-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({
+            'meta': {
+                'commit': commit,
+                'timestamp': datetime.now().isoformat(),
+                'email': email,
+                'requests': args.requests,
+                'concurrency': args.concurrency,
+                'database': main.engine.url.render_as_string(hide_password=True),
+            },
+            'results': results,
+        }, f, indent=2)
+    print(f"\nSaved {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main_cli()
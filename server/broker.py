@@ -0,0 +1,301 @@
+"""
+Server-push updates for the schedule board.
+
+Event, assignment and process_point changes are collected from the ORM in
+after_flush and fanned out to Server-Sent Events subscribers once the
+transaction commits:
+
+- memory backend (default): published to this process's broker after commit.
+  Fine for a single worker.
+- postgres backend (RELAY_SSE_BACKEND=postgres): sent with pg_notify inside the
+  writing transaction, so Postgres delivers it only on commit, to every worker.
+  Each worker runs one LISTEN thread that feeds its local broker.
+
+Subscribers only hold a small queue, so an idle stream costs next to nothing.
+gunicorn.conf.py runs gevent workers so thousands of them can stay open, and
+refuses to start more than one worker without the postgres backend.
+
+Streams carry deltas only. A client that reconnects (or receives a `resync`
+event because it fell behind) should catch up through /api/changes.
+"""
+
+import itertools
+import json
+import os
+import queue
+import select
+import threading
+
+from sqlalchemy import event, inspect, text
+from sqlalchemy.orm import Session as OrmSession
+from sqlalchemy.orm.exc import ObjectDeletedError
+
+from cache import company_ids_for
+
+
+# Broker configuration
+BROKER_CONFIG = {
+    'backend': os.getenv('RELAY_SSE_BACKEND', 'memory'),  # memory or postgres
+    'channel': 'schedule_board',
+    'heartbeat': int(os.getenv('RELAY_SSE_HEARTBEAT', '15')),  # Seconds between keep-alives
+    'queue_size': 256,  # Messages buffered per subscriber before it is told to resync
+    'max_notify_bytes': 7900,
+}
+
+# Event attributes the board cares about
+BOARD_FIELDS = (
+    'name', 'date', 'start_time', 'end_time', 'location', 'quick_turn',
+    'deadline', 'process_point', 'column_number', 'project_id',
+)
+
+# Queued to a subscriber that fell too far behind
+RESYNC = object()
+
+
+class Subscription:
+    """One SSE client, optionally filtered to a company and/or a date"""
+
+    def __init__(self, company_id=None, date=None, maxsize=256):
+        self.company_id = company_id
+        self.date = date
+        self.queue = queue.Queue(maxsize)
+
+    def matches(self, message):
+        if self.company_id is not None and self.company_id not in message['company_ids']:
+            return False
+        if self.date is not None and self.date not in message['dates']:
+            return False
+        return True
+
+    def next(self, timeout):
+        """Next (id, message), RESYNC, or None when the heartbeat interval passed"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class Broker:
+    """In-process fan-out of board messages to matching subscribers"""
+
+    def __init__(self, queue_size=256):
+        self.queue_size = queue_size
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def subscribe(self, company_id=None, date=None):
+        subscription = Subscription(company_id, date, self.queue_size)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, message):
+        message_id = next(self._ids)
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            if not subscription.matches(message):
+                continue
+            try:
+                subscription.queue.put_nowait((message_id, message))
+            except queue.Full:
+                # Slow client: drop its backlog and ask it to resync from /api/changes
+                self.unsubscribe(subscription)
+                with subscription.queue.mutex:
+                    subscription.queue.queue.clear()
+                subscription.queue.put_nowait(RESYNC)
+
+    def __len__(self):
+        return len(self._subscribers)
+
+
+board_broker = Broker(BROKER_CONFIG['queue_size'])
+
+
+def format_sse(message_id, event_type, data):
+    return f"id: {message_id}\nevent: {event_type}\ndata: {json.dumps(data)}\n\n"
+
+
+def stream(subscription, heartbeat=None):
+    """Generator of SSE frames for a subscription; unsubscribes when the client goes away"""
+    heartbeat = heartbeat or BROKER_CONFIG['heartbeat']
+    try:
+        yield "retry: 3000\n\n"
+        while True:
+            item = subscription.next(timeout=heartbeat)
+            if item is None:
+                yield ": keep-alive\n\n"
+            elif item is RESYNC:
+                yield "event: resync\ndata: {}\n\n"
+                return
+            else:
+                message_id, message = item
+                yield format_sse(message_id, message['type'], message)
+    finally:
+        board_broker.unsubscribe(subscription)
+
+
+# Postgres LISTEN/NOTIFY fan-out
+
+_listener_lock = threading.Lock()
+_listener_thread = None
+
+
+def _listen(engine):
+    connection = engine.raw_connection()
+    try:
+        dbapi_connection = connection.driver_connection
+        dbapi_connection.autocommit = True
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"LISTEN {BROKER_CONFIG['channel']}")
+        while True:
+            if select.select([dbapi_connection], [], [], BROKER_CONFIG['heartbeat']) == ([], [], []):
+                continue
+            dbapi_connection.poll()
+            while dbapi_connection.notifies:
+                notify = dbapi_connection.notifies.pop(0)
+                board_broker.publish(json.loads(notify.payload))
+    except Exception as e:
+        print(f"Schedule board listener stopped: {e}")
+    finally:
+        connection.close()
+
+
+def ensure_listener(engine):
+    """Start this worker's LISTEN thread (postgres backend only); safe to call per request"""
+    global _listener_thread
+    if BROKER_CONFIG['backend'] != 'postgres':
+        return
+    with _listener_lock:
+        if _listener_thread is None or not _listener_thread.is_alive():
+            _listener_thread = threading.Thread(target=_listen, args=(engine,), daemon=True)
+            _listener_thread.start()
+
+
+# Collecting board changes from the ORM
+
+def _history(obj, attr):
+    return inspect(obj).attrs[attr].history
+
+
+def _values(obj, attr):
+    """Current and previous values of an attribute, without None"""
+    history = _history(obj, attr)
+    values = set(history.added or ()) | set(history.unchanged or ()) | set(history.deleted or ())
+    return [value for value in values if value is not None]
+
+
+def _event_message(session, obj, kind, memo):
+    changed = [field for field in BOARD_FIELDS if _history(obj, field).has_changes()]
+    assignments = _history(obj, 'personnels')
+    if kind == 'updated':
+        if not changed and not assignments.has_changes():
+            return None
+        if not changed:
+            kind = 'assignment'
+
+    message = {
+        'type': f'event.{kind}',
+        'event_id': obj.id,
+        'project_id': obj.project_id,
+        'date': obj.date,
+        'process_point': obj.process_point,
+        'column_number': obj.column_number,
+        'changed': changed,
+        # An event moved between dates/companies is delivered to both sides
+        'dates': _values(obj, 'date'),
+        'company_ids': [c for c in company_ids_for(session, obj, memo) if c is not None],
+    }
+    if assignments.has_changes() or kind == 'created':
+        message['personnel_ids'] = [p.id for p in obj.personnels]
+    return message
+
+
+def _assignment_messages(session, personnel, memo, reported):
+    """Assignment deltas recorded on the personnel side of personnel_event_association"""
+    history = _history(personnel, 'events')
+    messages = []
+    for events, assigned in ((history.added or (), True), (history.deleted or (), False)):
+        for obj in events:
+            if obj.id in reported:
+                continue
+            messages.append({
+                'type': 'event.assignment',
+                'event_id': obj.id,
+                'project_id': obj.project_id,
+                'date': obj.date,
+                'personnel_id': personnel.id,
+                'assigned': assigned,
+                'changed': [],
+                'dates': [obj.date],
+                'company_ids': [c for c in company_ids_for(session, obj, memo) if c is not None],
+            })
+    return messages
+
+
+@event.listens_for(OrmSession, 'after_flush')
+def _collect_board_changes(session, flush_context):
+    memo = {}
+    messages = []
+    for kind, objects in (('created', session.new), ('updated', session.dirty), ('deleted', session.deleted)):
+        for obj in objects:
+            if getattr(obj, '__tablename__', None) != 'events':
+                continue
+            try:
+                message = _event_message(session, obj, kind, memo)
+            except ObjectDeletedError:
+                # Deleted without its row ever being loaded; all we know is the id
+                message = {
+                    'type': 'event.deleted', 'event_id': inspect(obj).identity[0],
+                    'changed': [], 'dates': [], 'company_ids': [],
+                }
+            if message is not None:
+                messages.append(message)
+
+    reported = {m['event_id'] for m in messages if 'personnel_ids' in m or m['type'] == 'event.deleted'}
+    for obj in session.dirty:
+        if getattr(obj, '__tablename__', None) == 'personnels':
+            messages.extend(_assignment_messages(session, obj, memo, reported))
+    send_board_messages(session, messages)
+
+
+def send_board_messages(session, messages):
+    """Deliver board messages when the session's transaction commits
+
+    Also for writes made with Core statements, which after_flush never sees.
+    """
+    if not messages:
+        return
+
+    if BROKER_CONFIG['backend'] == 'postgres':
+        # Delivered by Postgres when (and only if) the transaction commits
+        for message in messages:
+            payload = json.dumps(message)
+            if len(payload) > BROKER_CONFIG['max_notify_bytes']:
+                # Too big for NOTIFY (8000 bytes): send the routing fields, clients refetch the rest
+                payload = json.dumps({
+                    'type': message['type'], 'dates': message['dates'],
+                    'company_ids': message['company_ids'], 'truncated': True,
+                })
+            session.execute(
+                text("SELECT pg_notify(:channel, :payload)"),
+                {'channel': BROKER_CONFIG['channel'], 'payload': payload},
+            )
+    else:
+        session.info.setdefault('board_pending', []).extend(messages)
+
+
+@event.listens_for(OrmSession, 'after_commit')
+def _publish_board_changes(session):
+    for message in session.info.pop('board_pending', ()):
+        board_broker.publish(message)
+
+
+@event.listens_for(OrmSession, 'after_rollback')
+def _discard_board_changes(session):
+    session.info.pop('board_pending', None)
@@ -0,0 +1,461 @@
+"""
+Response cache for the list endpoints.
+
+Cached payloads live in a small in-process LRU. Entries are keyed by endpoint,
+query args, company scope and the current version of every table the endpoint
+reads, so invalidation never has to find and delete keys: a write simply bumps
+the version of (table, company) and the next read misses.
+
+Versions are kept where every gunicorn worker sees them: in Redis when
+RELAY_CACHE_REDIS_URL is set, otherwise in the cache_versions table (see
+init_cache_versions). A write handled by one worker therefore invalidates the
+LRU of every other worker, at the cost of one version lookup per cached read.
+The in-process LocalBackend is only used before init_cache_versions runs, by
+scripts that never serve requests.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import bindparam, event, inspect, text
+from sqlalchemy.orm import Session as OrmSession
+from sqlalchemy.orm.exc import ObjectDeletedError
+
+
+# Cache configuration
+CACHE_CONFIG = {
+    'enabled': os.getenv('RELAY_RESPONSE_CACHE', '1') != '0',
+    'max_entries': int(os.getenv('RELAY_CACHE_MAX_ENTRIES', '512')),
+    'ttl': int(os.getenv('RELAY_CACHE_TTL', '300')),  # Seconds, shared backend only
+    'redis_url': os.getenv('RELAY_CACHE_REDIS_URL', ''),
+}
+
+# Scope used for unfiltered lists (super admin views spanning every company)
+ALL_COMPANIES = '*'
+# Scope bumped when a write cannot be traced back to a company
+UNKNOWN_COMPANY = '?'
+# Returned by a scope function when the request should not be cached at all
+BYPASS = object()
+
+
+class LRUCache:
+    """Thread-safe least-recently-used cache with a fixed number of entries"""
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class LocalBackend:
+    """In-process stand-in for the shared backend (single worker and tests)"""
+
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            return self._values.get(key)
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._values[key] = value
+
+    def incr(self, key):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + 1
+            return self._values[key]
+
+    def get_many(self, keys):
+        with self._lock:
+            return [self._values.get(key) for key in keys]
+
+    def incr_many(self, keys):
+        for key in keys:
+            self.incr(key)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class RedisBackend:
+    """Shared backend on Redis so every worker sees the same entries and versions"""
+
+    def __init__(self, url):
+        import redis  # Optional dependency, only needed when RELAY_CACHE_REDIS_URL is set
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        value = self._client.get(key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl=None):
+        self._client.set(key, json.dumps(value), ex=ttl)
+
+    def incr(self, key):
+        return self._client.incr(key)
+
+    def get_many(self, keys):
+        return [json.loads(value) if value is not None else None for value in self._client.mget(keys)]
+
+    def incr_many(self, keys):
+        pipeline = self._client.pipeline(transaction=False)
+        for key in keys:
+            pipeline.incr(key)
+        pipeline.execute()
+
+    def clear(self):
+        self._client.flushdb()
+
+
+_VERSIONS_SQL = text("SELECT key, value FROM cache_versions WHERE key IN :keys").bindparams(
+    bindparam('keys', expanding=True)
+)
+_BUMP_SQL = text(
+    "INSERT INTO cache_versions (key, value) VALUES (:key, 1) "
+    "ON CONFLICT (key) DO UPDATE SET value = cache_versions.value + 1"
+)
+
+
+class DatabaseBackend:
+    """Version counters in the cache_versions table, for every worker when there is no Redis"""
+
+    def __init__(self, session_factory):
+        self.session_factory = session_factory
+
+    def _execute(self, statement, parameters=None, fetch=False):
+        session = self.session_factory()
+        try:
+            result = session.execute(statement.execution_options(skip_tenant_scope=True), parameters)
+            rows = result.fetchall() if fetch else None
+            session.commit()
+            return rows
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def get_many(self, keys):
+        values = dict(self._execute(_VERSIONS_SQL, {'keys': list(keys)}, fetch=True)) if keys else {}
+        return [values.get(key) for key in keys]
+
+    def incr_many(self, keys):
+        if keys:
+            self._execute(
+                _BUMP_SQL,
+                [{'key': key} for key in sorted(keys)],  # Sorted so concurrent writers lock rows in one order
+            )
+
+    def clear(self):
+        self._execute(text("DELETE FROM cache_versions"))
+
+
+class TableVersions:
+    """Version counters per (table, company), bumped after every committed write"""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def _values(self, keys):
+        """Current value of each key; read once per GET request, however many callers ask"""
+        memo = None
+        if has_request_context() and request.method == 'GET':
+            memo = g.setdefault('table_versions', {})
+        missing = [key for key in keys if memo is None or key not in memo]
+        fetched = dict(zip(missing, self.backend.get_many(missing))) if missing else {}
+        if memo is not None:
+            memo.update(fetched)
+            fetched = memo
+        return [int(fetched[key] or 0) for key in keys]
+
+    def bump_many(self, writes):
+        """Invalidate everything that read each (table, company) written (and the unscoped lists)"""
+        keys = set()
+        for table, company_id in writes:
+            scope = UNKNOWN_COMPANY if company_id is None else company_id
+            keys.add(f'version:{table}:{scope}')
+            keys.add(f'version:{table}:{ALL_COMPANIES}')
+        self.backend.incr_many(keys)
+
+    def scope_versions(self, tables, scope):
+        """Version vector for a read of `tables` at the given company scope"""
+        if scope == ALL_COMPANIES:
+            return self._values([f'version:{table}:{ALL_COMPANIES}' for table in tables])
+        # A scoped read must also notice writes whose company could not be resolved
+        values = self._values([
+            f'version:{table}:{key_scope}' for table in tables for key_scope in (scope, UNKNOWN_COMPANY)
+        ])
+        return [tuple(values[i:i + 2]) for i in range(0, len(values), 2)]
+
+    def fingerprint(self, endpoint, tables, scope, args):
+        """Stable digest of a read: changes whenever any table it depends on is written"""
+        raw = json.dumps([
+            endpoint,
+            str(scope),
+            self.scope_versions(tables, scope),
+            sorted(args.items(multi=True)),
+        ])
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+
+class CachedEntry:
+    """A cached payload and its compressed bodies by encoding, sharing one LRU slot"""
+
+    __slots__ = ('payload', 'variants')
+
+    def __init__(self, payload):
+        self.payload = payload
+        self.variants = {}  # e.g. {'gzip': b'...'}, filled by compression.py, this process only
+
+
+class ResponseCache:
+    """LRU in front of an optional shared backend, keyed by table versions"""
+
+    def __init__(self, versions, max_entries=512, shared=None, ttl=300):
+        self.local = LRUCache(max_entries)
+        self.shared = shared
+        self.ttl = ttl
+        self.versions = versions
+
+    def make_key(self, endpoint, tables, scope, args):
+        return f'response:{endpoint}:{scope}:' + self.versions.fingerprint(endpoint, tables, scope, args)
+
+    def get(self, key):
+        """CachedEntry for key, or None"""
+        entry = self.local.get(key)
+        if entry is None and self.shared is not None:
+            payload = self.shared.get(key)
+            if payload is not None:
+                entry = CachedEntry(payload)
+                self.local.set(key, entry)
+        return entry
+
+    def set(self, key, payload):
+        self.local.set(key, CachedEntry(payload))
+        if self.shared is not None:
+            self.shared.set(key, payload, ttl=self.ttl)
+
+    def get_variant(self, key, encoding):
+        """Encoded body of a cached response (e.g. gzip), or None"""
+        entry = self.local.get(key)
+        return entry.variants.get(encoding) if entry is not None else None
+
+    def set_variant(self, key, encoding, body):
+        entry = self.local.get(key)
+        if entry is not None:  # Evicted meanwhile: nothing to attach it to
+            entry.variants[encoding] = body
+
+    def clear(self):
+        self.local.clear()
+
+
+shared_backend = RedisBackend(CACHE_CONFIG['redis_url']) if CACHE_CONFIG['redis_url'] else None
+# Versions must be visible to every worker: Redis if configured, else the database once init_cache_versions runs
+table_versions = TableVersions(shared_backend if shared_backend is not None else LocalBackend())
+response_cache = ResponseCache(
+    table_versions,
+    max_entries=CACHE_CONFIG['max_entries'],
+    shared=shared_backend,
+    ttl=CACHE_CONFIG['ttl'],
+)
+
+
+def init_cache_versions(session_factory):
+    """Keep table versions in the database unless Redis is configured, so every worker sees every write"""
+    if shared_backend is None:
+        table_versions.backend = DatabaseBackend(session_factory)
+
+
+def request_company_scope():
+    """Company scope of the current request: its tenant (see tenancy.py) or the company_id query arg"""
+    if g.get('tenant_scoped'):
+        company_id = g.get('tenant_company_id')
+        return company_id if company_id is not None else BYPASS
+    company_id = request.args.get('company_id')
+    if not company_id:
+        return ALL_COMPANIES
+    try:
+        return int(company_id)
+    except ValueError:
+        return BYPASS
+
+
+def global_scope():
+    """Scope for endpoints that are not filtered by a company_id arg (still tenant-scoped by token)"""
+    if g.get('tenant_scoped'):
+        return request_company_scope()
+    return ALL_COMPANIES
+
+
+def resource_dependencies(resource):
+    """Tables a resource reads and the function deriving its company scope"""
+    tables = getattr(resource, 'depends_on', ())
+    scope = getattr(resource, 'company_scope', None) or request_company_scope
+    return tables, scope
+
+
+def stored_variant_response(entry):
+    """Response carrying the stored body in the client's encoding (no JSON encoding), or None"""
+    from compression import negotiate_encoding  # compression.py imports this module
+
+    encoding = negotiate_encoding(request.accept_encodings)
+    body = entry.variants.get(encoding)
+    if body is None:
+        return None
+    response = current_app.response_class(body, status=200, mimetype='application/json')
+    response.headers['Content-Encoding'] = encoding
+    response.headers['X-Cache'] = 'HIT'
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def cached_response(endpoint):
+    """Cache a flask-restful GET handler's 200 responses by endpoint, args and company scope
+
+    The tables and scope come from the resource's `depends_on` and `company_scope`
+    attributes, which the ETag layer reads as well.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(self, *args, **kwargs):
+            if not CACHE_CONFIG['enabled']:
+                return func(self, *args, **kwargs)
+
+            tables, scope = resource_dependencies(type(self))
+            company_scope = scope()
+            if company_scope is BYPASS:
+                return func(self, *args, **kwargs)
+
+            key = response_cache.make_key(endpoint, tables, company_scope, request.args)
+            entry = response_cache.get(key)
+            if entry is not None:
+                g.response_cache_key = key  # Lets compression.py reuse its stored variants
+                if entry.variants:
+                    response = stored_variant_response(entry)
+                    if response is not None:
+                        return response
+                return entry.payload, 200, {'X-Cache': 'HIT'}
+
+            result = func(self, *args, **kwargs)
+            payload, status = result[0], result[1]
+            if status == 200:
+                response_cache.set(key, payload)
+                g.response_cache_key = key
+            return payload, status, {'X-Cache': 'MISS'}
+        return wrapper
+    return decorator
+
+
+# Invalidation
+#
+# Writes are collected in after_flush, where new rows already have their ids,
+# and only applied after commit so a rolled back transaction evicts nothing.
+
+TRACKED_TABLES = {
+    'companies', 'users', 'organizations', 'personnels', 'projects', 'events', 'shot_requests', 'images',
+}
+
+# Tables without a company_id column: which attribute leads to the company, and how
+# (events, shot requests and images carry a denormalized company_id)
+_COMPANY_LOOKUPS = {
+    'projects': ('organization_id', """
+        SELECT company_id FROM organizations WHERE id = :key
+    """),
+}
+
+
+def _attribute_values(obj, attr):
+    """Current and previous values of an attribute (both matter when a row changes company)"""
+    history = inspect(obj).attrs[attr].history
+    values = set(history.added or ()) | set(history.unchanged or ()) | set(history.deleted or ())
+    if not values:
+        try:
+            values.add(getattr(obj, attr, None))
+        except ObjectDeletedError:
+            values.add(None)
+    return values
+
+
+def company_ids_for(session, obj, memo=None):
+    """Every company a written row belongs (or belonged) to; None when it can't be resolved"""
+    table = obj.__tablename__
+    if table == 'companies':
+        return {obj.id}
+    if table not in _COMPANY_LOOKUPS:
+        return _attribute_values(obj, 'company_id')
+
+    attr, sql = _COMPANY_LOOKUPS[table]
+    memo = memo if memo is not None else {}
+    company_ids = set()
+    for key in _attribute_values(obj, attr):
+        if key is None:
+            company_ids.add(None)
+            continue
+        if (table, key) not in memo:
+            rows = session.execute(text(sql), {'key': key}).fetchall()
+            memo[(table, key)] = {row[0] for row in rows} or {None}
+        company_ids |= memo[(table, key)]
+    return company_ids
+
+
+def mark_written(session, table, company_ids):
+    """Record a write made with Core/bulk statements, which after_flush never sees"""
+    pending = session.info.setdefault('response_cache_pending', set())
+    for company_id in company_ids:
+        pending.add((table, company_id))
+
+
+@event.listens_for(OrmSession, 'after_flush')
+def _collect_cache_invalidations(session, flush_context):
+    pending = session.info.setdefault('response_cache_pending', set())
+    memo = {}
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        table = getattr(obj, '__tablename__', None)
+        if table not in TRACKED_TABLES:
+            continue
+        for company_id in company_ids_for(session, obj, memo):
+            pending.add((table, company_id))
+
+
+@event.listens_for(OrmSession, 'after_commit')
+def _apply_cache_invalidations(session):
+    pending = session.info.pop('response_cache_pending', None)
+    if pending:
+        try:
+            table_versions.bump_many(pending)
+        except Exception as e:
+            print(f"Failed to bump cache versions: {e}")
+
+
+@event.listens_for(OrmSession, 'after_rollback')
+def _discard_cache_invalidations(session):
+    session.info.pop('response_cache_pending', None)
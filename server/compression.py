@@ -0,0 +1,130 @@
+"""
+Negotiated response compression.
+
+JSON (and plain text) responses over RELAY_COMPRESS_MIN_BYTES are compressed
+with the best encoding the client accepts: zstd, then brotli, then gzip.
+gzip is always available; brotli and zstd are used when the `brotli` and
+`zstandard` packages are installed. Levels are tunable per encoding.
+
+Responses served by @cached_response are compressed once per encoding: the
+compressed body is kept in the payload's local response cache entry, so a
+cache hit returns the stored bytes without encoding JSON or recompressing.
+Other streamed responses (see representations.py) are compressed chunk by
+chunk.
+"""
+
+import os
+import zlib
+
+from flask import g, request
+
+from cache import response_cache
+
+try:
+    import brotli
+except ImportError:  # Optional
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # Optional
+    zstandard = None
+
+
+# Compression configuration
+COMPRESSION_CONFIG = {
+    'enabled': os.getenv('RELAY_COMPRESSION', '1') != '0',
+    'min_bytes': int(os.getenv('RELAY_COMPRESS_MIN_BYTES', '1024')),
+    'gzip_level': int(os.getenv('RELAY_GZIP_LEVEL', '6')),  # 1-9
+    'brotli_quality': int(os.getenv('RELAY_BROTLI_QUALITY', '5')),  # 0-11
+    'zstd_level': int(os.getenv('RELAY_ZSTD_LEVEL', '3')),  # 1-22
+    'mimetypes': {'application/json', 'text/plain'},
+}
+
+
+class _Compressor:
+    """Incremental compressor with one compress/finish interface for every encoding"""
+
+    def __init__(self, encoding):
+        if encoding == 'zstd':
+            self._obj = zstandard.ZstdCompressor(level=COMPRESSION_CONFIG['zstd_level']).compressobj()
+            self.compress, self._finish = self._obj.compress, self._obj.flush
+        elif encoding == 'br':
+            self._obj = brotli.Compressor(quality=COMPRESSION_CONFIG['brotli_quality'])
+            self.compress, self._finish = self._obj.process, self._obj.finish
+        else:
+            # wbits 31: gzip container
+            self._obj = zlib.compressobj(COMPRESSION_CONFIG['gzip_level'], zlib.DEFLATED, 31)
+            self.compress, self._finish = self._obj.compress, self._obj.flush
+
+    def finish(self):
+        return self._finish()
+
+
+def compress(body, encoding):
+    compressor = _Compressor(encoding)
+    return compressor.compress(body) + compressor.finish()
+
+
+def _stream(chunks, encoding):
+    compressor = _Compressor(encoding)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+def available_encodings():
+    """Encodings this process can produce, most preferred first"""
+    encodings = []
+    if zstandard is not None:
+        encodings.append('zstd')
+    if brotli is not None:
+        encodings.append('br')
+    encodings.append('gzip')
+    return encodings
+
+
+def negotiate_encoding(accept_encodings):
+    """Best encoding allowed by an Accept-Encoding header, or None"""
+    best, best_quality = None, 0
+    for encoding in available_encodings():
+        quality = accept_encodings.quality(encoding)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def init_compression(app):
+    """Compress eligible responses for clients that accept it"""
+    if not COMPRESSION_CONFIG['enabled']:
+        return
+
+    @app.after_request
+    def _compress(response):
+        if response.status_code != 200 or response.direct_passthrough \
+                or response.mimetype not in COMPRESSION_CONFIG['mimetypes'] \
+                or 'Content-Encoding' in response.headers:
+            return response
+        if not response.is_streamed and response.content_length < COMPRESSION_CONFIG['min_bytes']:
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = negotiate_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+
+        cache_key = g.get('response_cache_key')
+        if cache_key is not None:
+            body = response_cache.get_variant(cache_key, encoding)
+            if body is None:
+                body = compress(response.get_data(), encoding)
+                response_cache.set_variant(cache_key, encoding, body)
+            response.set_data(body)
+        elif response.is_streamed:
+            response.response = _stream(response.response, encoding)
+        else:
+            response.set_data(compress(response.get_data(), encoding))
+        response.headers['Content-Encoding'] = encoding
+        return response
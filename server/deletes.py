@@ -0,0 +1,266 @@
+"""
+Set-based cascade deletes for projects and companies.
+
+Deleting through the ORM loads every event, image and association of a project
+into memory and deletes them one row at a time. These helpers issue one DELETE
+per table instead, children before parents, with the affected ids expressed as
+subqueries so nothing is loaded into Python. Every helper runs in the caller's
+transaction and returns {table: rows deleted}.
+
+Core statements skip the ORM flush hooks, so cache invalidation is recorded
+with mark_written here; the schedule board stream doesn't see these deletes
+(clients catch up through /api/changes, which gets tombstones from the
+database triggers).
+
+Very large tenants can be deleted in the background (CompanyDeletion): their
+images partition is detached first, their projects go a batch per transaction,
+then the rest of the company in one last transaction, after which the
+partition is dropped.
+"""
+
+import threading
+import time
+
+from sqlalchemy import delete, select, update
+
+from cache import mark_written
+from models import (
+    Company,
+    User,
+    Organization,
+    Personnel,
+    Project,
+    Events,
+    ShotRequest,
+    Image,
+    event_request_association_table as event_requests,
+    personnel_event_association_table as personnel_events,
+    personnel_shot_request_association_table as personnel_shot_requests,
+    project_requests_association_table as project_requests,
+    project_personnel_association_table as project_personnel,
+)
+from partitions import attach_image_partition, detach_image_partition, drop_image_partition
+
+
+def _run(session, counts, label, statement):
+    counts[label] = counts.get(label, 0) + session.execute(statement).rowcount
+
+
+def delete_projects(session, project_ids, company_id=None):
+    """Delete projects with their events, images and orphaned shot requests
+
+    project_ids may be a list or a select of ids. A shot request is deleted
+    with the project only when all of its events are being deleted, as
+    ProjectDetail.delete always did.
+    """
+    counts = {}
+    event_ids = select(Events.id).where(Events.project_id.in_(project_ids))
+    # Evaluated by each statement below, so the association rows it reads must go last
+    other_events = select(event_requests.c.shot_request_id).where(event_requests.c.event_id.not_in(event_ids))
+    orphaned_ids = (
+        select(event_requests.c.shot_request_id)
+        .where(event_requests.c.event_id.in_(event_ids))
+        .where(event_requests.c.shot_request_id.not_in(other_events))
+    )
+
+    images = delete(Image.__table__).where(Image.event_id.in_(event_ids) | Image.requests_id.in_(orphaned_ids))
+    if company_id is not None:
+        images = images.where(Image.company_id == company_id)  # Lets Postgres scan only that partition
+    _run(session, counts, 'images', images)
+    _run(session, counts, 'personnel_shot_request_association', delete(personnel_shot_requests).where(
+        personnel_shot_requests.c.shot_request_id.in_(orphaned_ids)
+    ))
+    _run(session, counts, 'project_requests_association', delete(project_requests).where(
+        project_requests.c.shot_request_id.in_(orphaned_ids) | project_requests.c.project_id.in_(project_ids)
+    ))
+    _run(session, counts, 'shot_requests', delete(ShotRequest.__table__).where(ShotRequest.id.in_(orphaned_ids)))
+    _run(session, counts, 'event_request_association', delete(event_requests).where(
+        event_requests.c.event_id.in_(event_ids)
+    ))
+    _run(session, counts, 'personnel_event_association', delete(personnel_events).where(
+        personnel_events.c.event_id.in_(event_ids)
+    ))
+    _run(session, counts, 'events', delete(Events.__table__).where(Events.project_id.in_(project_ids)))
+    _run(session, counts, 'project_personnel_association', delete(project_personnel).where(
+        project_personnel.c.project_id.in_(project_ids)
+    ))
+    _run(session, counts, 'projects', delete(Project.__table__).where(Project.id.in_(project_ids)))
+
+    for table in ('projects', 'events', 'shot_requests', 'images', 'personnels'):
+        mark_written(session, table, [company_id])
+    return counts
+
+
+def company_project_ids(company_id):
+    return select(Project.id).join(Organization, Organization.id == Project.organization_id) \
+        .where(Organization.company_id == company_id)
+
+
+def delete_company(session, company_id):
+    """Delete a company and everything it owns; its users are kept, detached from it
+
+    A partitioned images table keeps the company's partition: detach it first
+    and drop it after committing (see commit_company_deletion).
+    """
+    counts = {}
+    counts_projects = delete_projects(session, company_project_ids(company_id), company_id)
+    for table, count in counts_projects.items():
+        counts[table] = counts.get(table, 0) + count
+
+    # Whatever the project cascade didn't reach: unassigned events, shot requests and personnel
+    event_ids = select(Events.id).where(Events.company_id == company_id)
+    shot_request_ids = select(ShotRequest.id).where(ShotRequest.company_id == company_id)
+    personnel_ids = select(Personnel.id).where(Personnel.company_id == company_id)
+
+    _run(session, counts, 'images', delete(Image.__table__).where(Image.company_id == company_id))
+    _run(session, counts, 'event_request_association', delete(event_requests).where(
+        event_requests.c.event_id.in_(event_ids) | event_requests.c.shot_request_id.in_(shot_request_ids)
+    ))
+    _run(session, counts, 'personnel_event_association', delete(personnel_events).where(
+        personnel_events.c.event_id.in_(event_ids) | personnel_events.c.personnel_id.in_(personnel_ids)
+    ))
+    _run(session, counts, 'personnel_shot_request_association', delete(personnel_shot_requests).where(
+        personnel_shot_requests.c.shot_request_id.in_(shot_request_ids)
+        | personnel_shot_requests.c.personnel_id.in_(personnel_ids)
+    ))
+    _run(session, counts, 'project_requests_association', delete(project_requests).where(
+        project_requests.c.shot_request_id.in_(shot_request_ids)
+    ))
+    _run(session, counts, 'project_personnel_association', delete(project_personnel).where(
+        project_personnel.c.personnel_id.in_(personnel_ids)
+    ))
+    _run(session, counts, 'shot_requests', delete(ShotRequest.__table__).where(ShotRequest.company_id == company_id))
+    _run(session, counts, 'events', delete(Events.__table__).where(Events.company_id == company_id))
+    _run(session, counts, 'personnels', delete(Personnel.__table__).where(Personnel.company_id == company_id))
+
+    # Users survive their company (users.company_id is ON DELETE SET NULL)
+    organization_ids = select(Organization.id).where(Organization.company_id == company_id)
+    _run(session, counts, 'users_detached', update(User.__table__).where(
+        (User.company_id == company_id) | User.organization_id.in_(organization_ids)
+    ).values(company_id=None, organization_id=None))
+    _run(session, counts, 'organizations', delete(Organization.__table__).where(Organization.company_id == company_id))
+    _run(session, counts, 'companies', delete(Company.__table__).where(Company.id == company_id))
+
+    for table in ('companies', 'users', 'organizations', 'personnels', 'projects', 'events', 'shot_requests', 'images'):
+        mark_written(session, table, [company_id])
+    return counts
+
+
+def commit_company_deletion(session, company_id, detached=False):
+    """Delete a company and commit, dropping its images partition as a unit
+
+    The partition is detached before the delete (DETACH ... CONCURRENTLY can't
+    run in a transaction) and dropped only once the delete has committed; if
+    the delete fails it is attached again, so the company keeps its images.
+    detached=True means the caller already detached it (and owns its recovery).
+    """
+    engine = session.get_bind()
+    dropped_images = None if detached else detach_image_partition(engine, company_id)
+    try:
+        counts = delete_company(session, company_id)
+        session.commit()
+    except Exception:
+        session.rollback()
+        if dropped_images is not None:
+            attach_image_partition(engine, company_id)
+        raise
+    if dropped_images:
+        counts['images'] = counts.get('images', 0) + dropped_images
+    _drop_detached_images(engine, company_id)
+    return counts
+
+
+def _drop_detached_images(engine, company_id):
+    # The company is gone at this point; a failed drop leaves an orphan table, not a half-deleted company
+    try:
+        drop_image_partition(engine, company_id)
+    except Exception as e:
+        print(f"Company {company_id} deleted, but dropping its detached images partition failed: {e}")
+
+
+class CompanyDeletion:
+    """Deletes a large company in the background, a batch of projects per transaction"""
+
+    def __init__(self, session_factory, company_id, batch_size=50):
+        self.session_factory = session_factory
+        self.company_id = company_id
+        self.batch_size = batch_size
+        self.status = 'pending'  # pending, running, done or failed
+        self.counts = {}
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        self._thread = threading.Thread(target=self._run, name=f'delete-company-{company_id}', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _add(self, counts):
+        for table, count in counts.items():
+            self.counts[table] = self.counts.get(table, 0) + count
+
+    def _run(self):
+        self.status = 'running'
+        self.started_at = time.time()
+        try:
+            # Detached up front so the batches below never delete images row by row. A failed
+            # run leaves it detached (reattaching would fail validation against events already
+            # deleted); running the deletion again picks it up and drops it.
+            session = self.session_factory()
+            try:
+                dropped_images = detach_image_partition(session.get_bind(), self.company_id)
+            finally:
+                session.close()
+            if dropped_images:
+                self._add({'images': dropped_images})
+
+            while True:
+                session = self.session_factory()
+                try:
+                    project_ids = session.execute(
+                        company_project_ids(self.company_id).limit(self.batch_size)
+                    ).scalars().all()
+                    if not project_ids:
+                        break
+                    self._add(delete_projects(session, project_ids, self.company_id))
+                    session.commit()
+                finally:
+                    session.close()
+
+            session = self.session_factory()
+            try:
+                self._add(commit_company_deletion(session, self.company_id, detached=True))
+            finally:
+                session.close()
+            self.status = 'done'
+        except Exception as e:
+            print(f"Background delete of company {self.company_id} failed: {e}")
+            self.status = 'failed'
+            self.error = str(e)
+        finally:
+            self.finished_at = time.time()
+
+    def payload(self):
+        return {
+            'company_id': self.company_id,
+            'status': self.status,
+            'deleted': self.counts,
+            'error': self.error,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+
+
+# Background deletions started by this process, by company id
+company_deletions = {}
+_deletions_lock = threading.Lock()
+
+
+def start_company_deletion(session_factory, company_id):
+    """Start (or return the running) background deletion of a company"""
+    with _deletions_lock:
+        job = company_deletions.get(company_id)
+        if job is None or job.status in ('done', 'failed'):
+            job = company_deletions[company_id] = CompanyDeletion(session_factory, company_id).start()
+        return job
@@ -0,0 +1,60 @@
+"""
+ETag and conditional GET support for the flask-restful resources.
+
+ETags are not computed by hashing the response body. A resource declares the
+tables it reads (`depends_on`) and how its company scope is derived
+(`company_scope`); the ETag is a digest of the endpoint, query args, scope and
+the current table versions kept by cache.py, which every worker shares (Redis
+or the cache_versions table). A GET whose If-None-Match still matches is
+answered with 304 before the resource runs a single query.
+
+A resource whose output can change without a table write sets
+`conditional_get = False` (e.g. the change feed, which holds rows back until
+older transactions finish).
+"""
+
+from flask import current_app, g, request
+
+from cache import resource_dependencies, table_versions, BYPASS
+
+
+def compute_etag():
+    """Weak validator for the current GET, or None if the resource doesn't declare its tables"""
+    view = current_app.view_functions.get(request.endpoint)
+    resource = getattr(view, 'view_class', None)
+    if resource is None or not getattr(resource, 'conditional_get', True):
+        return None
+    tables, scope_func = resource_dependencies(resource)
+    if not tables:
+        return None
+    scope = scope_func()
+    if scope is BYPASS:
+        return None
+    view_args = sorted((request.view_args or {}).items())
+    endpoint = f'{request.endpoint}:{view_args}'
+    return table_versions.fingerprint(endpoint, tables, scope, request.args)[:20]
+
+
+def init_conditional_get(app):
+    """Answer matching If-None-Match GETs with 304 and tag 200 responses with an ETag"""
+
+    @app.before_request
+    def _not_modified():
+        if request.method != 'GET':
+            return None
+        etag = compute_etag()
+        if etag is None:
+            return None
+        g.etag = etag
+        if request.if_none_match.contains_weak(etag):
+            response = app.response_class(status=304)
+            response.set_etag(etag, weak=True)
+            return response
+        return None
+
+    @app.after_request
+    def _attach_etag(response):
+        etag = g.pop('etag', None)
+        if etag is not None and response.status_code == 200:
+            response.set_etag(etag, weak=True)
+        return response
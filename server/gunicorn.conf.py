@@ -0,0 +1,54 @@
+"""
+gunicorn settings for Relay: gunicorn -c gunicorn.conf.py main:app
+
+For /metrics to cover every worker, point PROMETHEUS_MULTIPROC_DIR at an empty
+directory before starting gunicorn (the workers write their metrics there):
+
+    rm -rf /tmp/relay-metrics && mkdir /tmp/relay-metrics
+    PROMETHEUS_MULTIPROC_DIR=/tmp/relay-metrics gunicorn -c gunicorn.conf.py main:app
+
+Workers are gevent workers so open /api/events/stream connections don't each
+tie up a worker. With more than one worker, board updates must go through
+Postgres (RELAY_SSE_BACKEND=postgres); the memory backend only reaches the
+clients of the worker that made the change.
+"""
+
+import os
+
+bind = os.getenv('RELAY_BIND', '0.0.0.0:5001')
+workers = int(os.getenv('RELAY_WORKERS', '4'))
+worker_class = os.getenv('RELAY_WORKER_CLASS', 'gevent')
+worker_connections = int(os.getenv('RELAY_WORKER_CONNECTIONS', '2000'))
+
+if workers > 1 and os.getenv('RELAY_SSE_BACKEND', 'memory') != 'postgres':
+    raise RuntimeError(
+        f"RELAY_WORKERS={workers} needs RELAY_SSE_BACKEND=postgres, "
+        "otherwise board updates only reach clients of the worker that made them"
+    )
+
+
+def post_fork(server, worker):
+    """Let psycopg2 yield to other greenlets while it waits on Postgres"""
+    if worker_class != 'gevent':
+        return
+    try:  # Optional
+        from psycogreen.gevent import patch_psycopg
+    except ImportError:
+        print("⚠️ psycogreen not installed; database calls will block the gevent worker")
+        return
+    patch_psycopg()
+
+
+def post_worker_init(worker):
+    """Build the autocomplete indexes and start the email outbox sender in each worker"""
+    from main import Session, outbox_sender
+    from autocomplete import start_autocomplete_warmup
+    start_autocomplete_warmup(Session)
+    outbox_sender.start()  # Drain mail queued before a restart; workers claim rows with SKIP LOCKED
+
+
+def child_exit(server, worker):
+    """Drop a dead worker's live gauges (e.g. its pool connections) from /metrics"""
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,273 @@
+"""
+Outbound email queue.
+
+Request handlers never talk to SMTP. They add a row to email_outbox in their
+own transaction (so an approval and its email commit or roll back together)
+and wake the sender. The sender is a background thread per process that
+claims pending rows in batches, keeps one authenticated SMTP connection open
+while there is work, and retries failures with exponential backoff.
+
+To try it locally without a real mail server, run a stand-in such as aiosmtpd
+and point Relay at it:
+
+    python -m aiosmtpd -n -l localhost:8025
+    export RELAY_SMTP_SERVER=localhost RELAY_SMTP_PORT=8025
+    export RELAY_SMTP_STARTTLS=0 RELAY_SMTP_AUTH=0 RELAY_EMAIL=relay@localhost
+"""
+
+import smtplib
+import threading
+import time
+from datetime import datetime, timedelta
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from sqlalchemy import or_, and_
+
+from metrics import EMAILS
+from models import EmailOutbox
+
+
+# Sender tuning
+OUTBOX_CONFIG = {
+    'batch_size': 50,
+    'max_attempts': 5,
+    'backoff_seconds': 30,  # Doubled after every failed attempt
+    'poll_seconds': 30,  # Fallback poll when nobody wakes the sender
+    'idle_disconnect_seconds': 60,  # Close the SMTP connection after this long without mail
+    'claim_timeout_minutes': 10,  # Rows stuck in 'sending' this long are retried
+    'sent_retention_days': 7,  # Sent rows are deleted after this long
+    'purge_interval_seconds': 3600,
+}
+
+# Stored in place of a sent email's body, which may hold a temporary password
+REDACTED_BODY = '[redacted after delivery]'
+
+# Errors that will not go away by retrying
+PERMANENT_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused)
+
+
+def email_configured(config):
+    """Check the email config, returning an error message or None"""
+    if not config['email'] or config['email'] == 'relay.system@gmail.com':
+        return "Email not configured: RELAY_EMAIL environment variable not set"
+    if config.get('use_auth', True) and not config['password']:
+        return "Email not configured: RELAY_EMAIL_PASSWORD environment variable not set"
+    return None
+
+
+def queue_email(session, recipient, subject, body):
+    """Add an email to the outbox in the caller's transaction; sent after commit"""
+    entry = EmailOutbox(recipient=recipient, subject=subject, body=body, status='pending', attempts=0)
+    session.add(entry)
+    EMAILS.labels('queued').inc()
+    return entry
+
+
+def outbox_payload(entry):
+    return {
+        'id': entry.id,
+        'recipient': entry.recipient,
+        'subject': entry.subject,
+        'status': entry.status,
+        'attempts': entry.attempts,
+        'last_error': entry.last_error,
+        'created_at': entry.created_at.isoformat() if entry.created_at else None,
+        'next_attempt_at': entry.next_attempt_at.isoformat() if entry.next_attempt_at else None,
+        'sent_at': entry.sent_at.isoformat() if entry.sent_at else None,
+    }
+
+
+class OutboxSender:
+    """Background sender draining email_outbox over one reused SMTP connection"""
+
+    def __init__(self, session_factory, email_config, outbox_config=None):
+        self.session_factory = session_factory
+        self.email_config = email_config
+        self.config = dict(OUTBOX_CONFIG, **(outbox_config or {}))
+        self._smtp = None
+        self._last_used = 0
+        self._last_purge = 0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    # SMTP connection
+
+    def _connect(self):
+        config = self.email_config
+        print(f"Connecting to SMTP server: {config['smtp_server']}:{config['smtp_port']}")
+        smtp = smtplib.SMTP(config['smtp_server'], config['smtp_port'], timeout=30)
+        if config.get('use_starttls', True):
+            smtp.starttls()  # Enable TLS encryption
+        if config.get('use_auth', True):
+            smtp.login(config['email'], config['password'])
+        return smtp
+
+    def _connection(self):
+        """Reuse the open SMTP connection if the server still answers, otherwise reconnect"""
+        if self._smtp is not None:
+            try:
+                if self._smtp.noop()[0] == 250:
+                    return self._smtp
+            except smtplib.SMTPException:
+                pass
+            self._disconnect()
+        self._smtp = self._connect()
+        return self._smtp
+
+    def _disconnect(self):
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+        self._smtp = None
+
+    def _send(self, entry):
+        msg = MIMEMultipart()
+        msg['From'] = self.email_config['email']
+        msg['To'] = entry.recipient
+        msg['Subject'] = entry.subject
+        msg.attach(MIMEText(entry.body, 'plain'))
+        try:
+            self._connection().sendmail(self.email_config['email'], entry.recipient, msg.as_string())
+        except smtplib.SMTPServerDisconnected:
+            # The server dropped an idle connection between the check and the send; retry once
+            self._disconnect()
+            self._connection().sendmail(self.email_config['email'], entry.recipient, msg.as_string())
+        self._last_used = time.monotonic()
+
+    # Outbox processing
+
+    def _claim(self, session):
+        """Mark a batch of due rows as 'sending' so concurrent workers skip them"""
+        now = datetime.utcnow()
+        stale = now - timedelta(minutes=self.config['claim_timeout_minutes'])
+        entries = (
+            session.query(EmailOutbox)
+            .filter(or_(
+                and_(EmailOutbox.status == 'pending', EmailOutbox.next_attempt_at <= now),
+                and_(EmailOutbox.status == 'sending', EmailOutbox.claimed_at < stale),
+            ))
+            .order_by(EmailOutbox.id)
+            .limit(self.config['batch_size'])
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+        for entry in entries:
+            entry.status = 'sending'
+            entry.claimed_at = now
+        session.commit()
+        return entries
+
+    def _record_failure(self, entry, error, permanent=False):
+        entry.attempts += 1
+        entry.last_error = str(error)
+        if permanent or entry.attempts >= self.config['max_attempts']:
+            entry.status = 'failed'
+        else:
+            entry.status = 'pending'
+            delay = self.config['backoff_seconds'] * 2 ** (entry.attempts - 1)
+            entry.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+        EMAILS.labels('failed' if entry.status == 'failed' else 'retry').inc()
+
+    def run_once(self):
+        """Send one batch of due emails; returns the number of rows processed"""
+        session = self.session_factory()
+        try:
+            entries = self._claim(session)
+            if not entries:
+                return 0
+
+            config_error = email_configured(self.email_config)
+            for entry in entries:
+                if config_error:
+                    self._record_failure(entry, config_error, permanent=True)
+                    continue
+                try:
+                    self._send(entry)
+                    entry.attempts += 1
+                    entry.status = 'sent'
+                    entry.sent_at = datetime.utcnow()
+                    entry.last_error = None
+                    entry.body = REDACTED_BODY
+                    EMAILS.labels('sent').inc()
+                    print(f"Email sent successfully to {entry.recipient}")
+                except PERMANENT_ERRORS as e:
+                    self._record_failure(entry, e, permanent=True)
+                except smtplib.SMTPAuthenticationError as e:
+                    print(f"SMTP Authentication failed: {str(e)}")
+                    self._record_failure(entry, e)
+                    self._disconnect()
+                except (smtplib.SMTPException, OSError) as e:
+                    print(f"SMTP error occurred: {str(e)}")
+                    self._record_failure(entry, e)
+                    self._disconnect()
+                # Record each outcome right away so a crash mid-batch doesn't resend delivered mail
+                session.commit()
+            return len(entries)
+        except Exception as e:
+            session.rollback()
+            print(f"Email outbox error: {str(e)}")
+            return 0
+        finally:
+            session.close()
+
+    def purge(self):
+        """Delete sent rows older than the retention period; returns the number deleted"""
+        cutoff = datetime.utcnow() - timedelta(days=self.config['sent_retention_days'])
+        session = self.session_factory()
+        try:
+            # Rows sent before bodies were redacted on delivery
+            (
+                session.query(EmailOutbox)
+                .filter(EmailOutbox.status == 'sent', EmailOutbox.body != REDACTED_BODY)
+                .update({EmailOutbox.body: REDACTED_BODY}, synchronize_session=False)
+            )
+            deleted = (
+                session.query(EmailOutbox)
+                .filter(EmailOutbox.status == 'sent', EmailOutbox.sent_at < cutoff)
+                .delete(synchronize_session=False)
+            )
+            session.commit()
+            return deleted
+        except Exception as e:
+            session.rollback()
+            print(f"Email outbox purge error: {str(e)}")
+            return 0
+        finally:
+            session.close()
+
+    def _run(self):
+        while not self._stop.is_set():
+            if time.monotonic() - self._last_purge > self.config['purge_interval_seconds']:
+                self.purge()
+                self._last_purge = time.monotonic()
+            if self.run_once():
+                continue  # Keep draining while there is work
+            if self._smtp is not None and time.monotonic() - self._last_used > self.config['idle_disconnect_seconds']:
+                self._disconnect()
+            self._wake.wait(self.config['poll_seconds'])
+            self._wake.clear()
+        self._disconnect()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='email-outbox', daemon=True)
+                self._thread.start()
+
+    def wake(self):
+        """Tell the sender new mail was committed (starting it if needed)"""
+        self.start()
+        self._wake.set()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
@@ -0,0 +1,137 @@
+"""
+Prometheus metrics at /metrics.
+
+- relay_http_request_duration_seconds{resource, method, status}: histogram per
+  flask-restful resource (or plain route)
+- relay_db_pool_*: SQLAlchemy pool gauges (size, checked out, overflow)
+- relay_upload_files_total / relay_upload_bytes_total: use rate() for files
+  and bytes per second through /api/upload-images
+- relay_thumbnail_seconds: create_thumbnail() latency
+- relay_emails_total{outcome}: approval emails queued, sent, retried, failed
+
+Under gunicorn every worker has its own counters. Set PROMETHEUS_MULTIPROC_DIR
+to an empty directory before the workers start and use gunicorn.conf.py (which
+cleans up after dead workers); /metrics then aggregates all workers.
+
+prometheus_client is optional: without it the metrics are no-ops and
+/metrics answers 503.
+"""
+
+import os
+import time
+
+from flask import Response, g, request
+from sqlalchemy import event
+
+try:
+    import prometheus_client
+    from prometheus_client import multiprocess
+except ImportError:  # Optional
+    prometheus_client = None
+
+
+class _NoopMetric:
+    """Stands in for a metric when prometheus_client isn't installed"""
+
+    def labels(self, *args, **kwargs):
+        return self
+
+    def inc(self, amount=1):
+        pass
+
+    def set(self, value):
+        pass
+
+    def observe(self, value):
+        pass
+
+    def time(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def _metric(kind, name, documentation, labelnames=(), **kwargs):
+    if prometheus_client is None:
+        return _NoopMetric()
+    return getattr(prometheus_client, kind)(name, documentation, labelnames, **kwargs)
+
+
+REQUEST_SECONDS = _metric(
+    'Histogram', 'relay_http_request_duration_seconds', 'API request latency',
+    ('resource', 'method', 'status'),
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+# Gauges are summed over live workers in multiprocess mode
+POOL_SIZE = _metric('Gauge', 'relay_db_pool_size', 'Connections kept by the pool', multiprocess_mode='livesum')
+POOL_CHECKED_OUT = _metric(
+    'Gauge', 'relay_db_pool_checked_out', 'Connections currently in use', multiprocess_mode='livesum'
+)
+POOL_OVERFLOW = _metric(
+    'Gauge', 'relay_db_pool_overflow', 'Connections opened beyond the pool size', multiprocess_mode='livesum'
+)
+UPLOAD_FILES = _metric('Counter', 'relay_upload_files', 'Images stored by /api/upload-images')
+UPLOAD_BYTES = _metric('Counter', 'relay_upload_bytes', 'Bytes stored by /api/upload-images')
+THUMBNAIL_SECONDS = _metric(
+    'Histogram', 'relay_thumbnail_seconds', 'Thumbnail generation latency',
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+EMAILS = _metric('Counter', 'relay_emails', 'Approval emails by outcome', ('outcome',))
+
+
+def record_upload(files, size):
+    UPLOAD_FILES.inc(files)
+    UPLOAD_BYTES.inc(size)
+
+
+def _pool_gauges(pool):
+    if not hasattr(pool, 'checkedout'):
+        return  # e.g. NullPool/StaticPool keep no counts
+    POOL_SIZE.set(pool.size())
+    POOL_CHECKED_OUT.set(pool.checkedout())
+    POOL_OVERFLOW.set(max(pool.overflow(), 0))
+
+
+def init_metrics(app, engine):
+    """Time every request, track the engine's pool and serve /metrics"""
+
+    @event.listens_for(engine, 'checkout')
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        _pool_gauges(engine.pool)
+
+    @event.listens_for(engine, 'checkin')
+    def _on_checkin(dbapi_connection, connection_record):
+        _pool_gauges(engine.pool)
+
+    def resource_label():
+        # Resource class name for api.add_resource routes, the endpoint for plain ones
+        view_class = getattr(app.view_functions.get(request.endpoint), 'view_class', None)
+        return view_class.__name__ if view_class else request.endpoint or 'unmatched'
+
+    @app.before_request
+    def _start_request_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def _observe_request(response):
+        started = g.pop('metrics_started', None)
+        if started is not None and request.endpoint != 'metrics':
+            REQUEST_SECONDS.labels(resource_label(), request.method, str(response.status_code)).observe(
+                time.perf_counter() - started
+            )
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        if prometheus_client is None:
+            return Response('prometheus_client is not installed\n', status=503, mimetype='text/plain')
+        if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+            registry = prometheus_client.CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = prometheus_client.REGISTRY
+        return Response(prometheus_client.generate_latest(registry), mimetype=prometheus_client.CONTENT_TYPE_LATEST)
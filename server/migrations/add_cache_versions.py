@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Migration: Add the cache_versions table
+
+Holds the per-(table, company) version counters of the response cache, ETags
+and autocomplete indexes when no Redis is configured, so a write handled by
+one worker is seen by every other worker.
+
+Date: 2025-03-28
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text
+
+# Use the same connection and model as main models
+from models import DATABASE_URL, CacheVersion
+
+engine = create_engine(DATABASE_URL)
+
+
+def run_migration():
+    """Create the cache_versions table"""
+    with engine.begin() as conn:
+        print("Creating cache_versions table...")
+        CacheVersion.__table__.create(conn, checkfirst=True)
+    print("✅ Successfully created cache_versions table")
+
+
+def rollback_migration():
+    """Drop the cache_versions table"""
+    with engine.begin() as conn:
+        print("Dropping cache_versions table...")
+        conn.execute(text("DROP TABLE IF EXISTS cache_versions"))
+    print("✅ Successfully dropped cache_versions table")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--rollback":
+        rollback_migration()
+    else:
+        run_migration()
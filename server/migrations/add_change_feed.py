@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Migration: Add change-feed tracking for incremental client sync
+
+This migration:
+1. Creates the change_tombstones table
+2. Creates the shared change_seq sequence
+3. Adds change_seq and change_xid (writing transaction id, PostgreSQL 13+)
+   columns, indexes and triggers to events, shot_requests, personnels,
+   images and projects
+4. Adds triggers on the association tables so assignment changes are tracked
+5. Backfills change_seq for existing rows
+
+Date: 2025-02-03
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text
+
+# Use the same connection and DDL as main models
+from models import DATABASE_URL, CHANGE_FEED_TABLES, CHANGE_FEED_ASSOCIATIONS, ChangeTombstone, install_change_feed
+
+engine = create_engine(DATABASE_URL)
+
+
+def run_migration():
+    """Run the change feed migration"""
+    with engine.begin() as conn:
+        print("🔄 Starting Change Feed Migration...")
+
+        print("📋 Step 1: Creating change_tombstones table...")
+        ChangeTombstone.__table__.create(conn, checkfirst=True)
+
+        print("📋 Step 2: Installing change_seq sequence, change_seq/change_xid columns and triggers...")
+        install_change_feed(conn)
+
+        print("📋 Step 3: Backfilling change_seq for existing rows...")
+        for table in CHANGE_FEED_TABLES:
+            # The BEFORE UPDATE trigger assigns the next sequence value
+            result = conn.execute(text(f"UPDATE {table} SET change_seq = 0 WHERE change_seq IS NULL"))
+            print(f"  ✅ {table}: {result.rowcount} rows")
+
+    print("\n🎉 Change feed migration completed successfully!")
+
+
+def rollback_migration():
+    """Remove change feed triggers, columns and tombstones"""
+    with engine.begin() as conn:
+        print("Removing change feed...")
+        for table in CHANGE_FEED_TABLES:
+            conn.execute(text(f"DROP TRIGGER IF EXISTS {table}_change_seq ON {table}"))
+            conn.execute(text(f"DROP TRIGGER IF EXISTS {table}_tombstone ON {table}"))
+            conn.execute(text(f"ALTER TABLE {table} DROP COLUMN IF EXISTS change_seq"))
+            conn.execute(text(f"ALTER TABLE {table} DROP COLUMN IF EXISTS change_xid"))
+        for table, *_ in CHANGE_FEED_ASSOCIATIONS:
+            conn.execute(text(f"DROP TRIGGER IF EXISTS {table}_touch ON {table}"))
+        conn.execute(text("DROP FUNCTION IF EXISTS relay_touch_change_seq()"))
+        conn.execute(text("DROP FUNCTION IF EXISTS relay_record_tombstone()"))
+        conn.execute(text("DROP FUNCTION IF EXISTS relay_touch_association()"))
+        conn.execute(text("DROP TABLE IF EXISTS change_tombstones"))
+        conn.execute(text("DROP SEQUENCE IF EXISTS change_seq"))
+    print("✅ Change feed removed")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--rollback":
+        rollback_migration()
+    else:
+        run_migration()
@@ -0,0 +1,135 @@
+"""
+Migration: Denormalize company_id onto events, shot_requests and images
+Date: 2025-03-04
+
+Adds the column and its foreign key, backfills it in id-range batches (one
+commit per batch, so no long lock on big tables), then builds the composite
+indexes led by company_id without blocking writes.
+"""
+
+from sqlalchemy import create_engine, text
+import sys
+import os
+
+# Add parent directory to path to import models
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import DATABASE_URL
+
+BATCH_SIZE = 10000
+
+TABLES = ['events', 'shot_requests', 'images']
+
+# Backfill statements per table, run for ids in [:start, :end). Order matters:
+# shot requests fall back to their events, images read events and shot requests.
+BACKFILLS = [
+    ('events', """
+        UPDATE events e SET company_id = o.company_id
+        FROM projects p JOIN organizations o ON o.id = p.organization_id
+        WHERE p.id = e.project_id AND e.id >= :start AND e.id < :end
+          AND e.company_id IS DISTINCT FROM o.company_id
+    """),
+    ('shot_requests', """
+        UPDATE shot_requests s SET company_id = src.company_id
+        FROM (
+            SELECT DISTINCT ON (a.shot_request_id) a.shot_request_id, o.company_id
+            FROM project_requests_association a
+            JOIN projects p ON p.id = a.project_id
+            JOIN organizations o ON o.id = p.organization_id
+            WHERE a.shot_request_id >= :start AND a.shot_request_id < :end AND o.company_id IS NOT NULL
+            ORDER BY a.shot_request_id, a.project_id
+        ) src
+        WHERE s.id = src.shot_request_id AND s.company_id IS DISTINCT FROM src.company_id
+    """),
+    ('shot_requests', """
+        UPDATE shot_requests s SET company_id = src.company_id
+        FROM (
+            SELECT DISTINCT ON (a.shot_request_id) a.shot_request_id, e.company_id
+            FROM event_request_association a
+            JOIN events e ON e.id = a.event_id
+            WHERE a.shot_request_id >= :start AND a.shot_request_id < :end AND e.company_id IS NOT NULL
+            ORDER BY a.shot_request_id, a.event_id
+        ) src
+        WHERE s.id = src.shot_request_id AND s.company_id IS NULL
+    """),
+    ('images', """
+        UPDATE images i SET company_id = e.company_id
+        FROM events e
+        WHERE e.id = i.event_id AND i.id >= :start AND i.id < :end
+          AND i.company_id IS DISTINCT FROM e.company_id
+    """),
+    ('images', """
+        UPDATE images i SET company_id = s.company_id
+        FROM shot_requests s
+        WHERE s.id = i.requests_id AND i.event_id IS NULL AND i.id >= :start AND i.id < :end
+          AND i.company_id IS DISTINCT FROM s.company_id
+    """),
+]
+
+# (index name, table, columns) - names match what models.py creates
+COMPANY_INDEXES = [
+    ('ix_events_company_id_date', 'events', 'company_id, date'),
+    ('ix_shot_requests_company_id_process_point', 'shot_requests', 'company_id, process_point'),
+    ('ix_images_company_id_event_id', 'images', 'company_id, event_id'),
+]
+
+
+def add_columns(engine):
+    """Add the nullable company_id columns (metadata-only, no table rewrite)"""
+    with engine.begin() as conn:
+        for table in TABLES:
+            print(f"Adding {table}.company_id...")
+            conn.execute(text(f"""
+                ALTER TABLE {table} ADD COLUMN IF NOT EXISTS company_id INTEGER
+                REFERENCES companies(id) ON DELETE CASCADE
+            """))
+
+
+def backfill(engine):
+    """Fill company_id one id range at a time, committing after each batch"""
+    for table, sql in BACKFILLS:
+        with engine.connect() as conn:
+            max_id = conn.execute(text(f"SELECT COALESCE(MAX(id), 0) FROM {table}")).scalar()
+        updated = 0
+        for start in range(1, max_id + 1, BATCH_SIZE):
+            with engine.begin() as conn:
+                updated += conn.execute(text(sql), {'start': start, 'end': start + BATCH_SIZE}).rowcount
+        print(f"Backfilled {updated} rows of {table}")
+
+
+def create_indexes(engine):
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction block
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        for name, table, columns in COMPANY_INDEXES:
+            print(f"Creating {name}...")
+            conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({columns})"))
+
+
+def run_migration():
+    """Add, backfill and index company_id on events, shot_requests and images"""
+    engine = create_engine(DATABASE_URL)
+    add_columns(engine)
+    backfill(engine)
+    create_indexes(engine)
+    print("✅ Successfully denormalized company_id")
+
+
+def rollback_migration():
+    """Drop the denormalized company_id columns and their indexes"""
+    engine = create_engine(DATABASE_URL)
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        for name, _, _ in COMPANY_INDEXES:
+            print(f"Dropping {name}...")
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+    with engine.begin() as conn:
+        for table in TABLES:
+            print(f"Dropping {table}.company_id...")
+            conn.execute(text(f"ALTER TABLE {table} DROP COLUMN IF EXISTS company_id"))
+    print("✅ Successfully removed denormalized company_id")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--rollback":
+        rollback_migration()
+    else:
+        run_migration()
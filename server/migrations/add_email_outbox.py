@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Migration: Add the email_outbox table for queued outbound email
+
+Date: 2025-02-10
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text
+
+# Use the same connection and model as main models
+from models import DATABASE_URL, EmailOutbox
+
+engine = create_engine(DATABASE_URL)
+
+
+def run_migration():
+    """Create the email_outbox table"""
+    with engine.begin() as conn:
+        print("Creating email_outbox table...")
+        EmailOutbox.__table__.create(conn, checkfirst=True)
+    print("✅ Successfully created email_outbox table")
+
+
+def rollback_migration():
+    """Drop the email_outbox table"""
+    with engine.begin() as conn:
+        print("Dropping email_outbox table...")
+        conn.execute(text("DROP TABLE IF EXISTS email_outbox"))
+    print("✅ Successfully dropped email_outbox table")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--rollback":
+        rollback_migration()
+    else:
+        run_migration()
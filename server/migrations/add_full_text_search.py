@@ -0,0 +1,90 @@
+"""
+Migration: Full-text search columns for events, shot_requests, personnels and projects
+Date: 2025-03-18
+
+Adds the search_vector columns and the triggers that keep them current (see
+SEARCH_COLUMNS in models.py), backfills existing rows in id-range batches,
+then builds the GIN indexes without blocking writes.
+
+The backfill runs each batch with SET LOCAL session_replication_role = replica,
+which skips row triggers for that transaction only (and needs a superuser):
+filling search_vector is not a change clients need to re-sync, so change_seq
+is left alone. Unlike ALTER TABLE ... DISABLE TRIGGER it takes no table lock
+and can't leave the trigger disabled if the migration dies mid-batch.
+"""
+
+from sqlalchemy import create_engine, text
+import sys
+import os
+
+# Add parent directory to path to import models
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import DATABASE_URL, SEARCH_COLUMNS, search_ddl, search_vector_sql
+
+BATCH_SIZE = 10000
+
+
+def add_columns_and_triggers(engine):
+    with engine.begin() as conn:
+        print("Adding search_vector columns and triggers...")
+        for statement in search_ddl(indexes=False):
+            conn.exec_driver_sql(statement)
+
+
+def backfill(engine):
+    """Fill search_vector one id range at a time, committing after each batch"""
+    for table in SEARCH_COLUMNS:
+        with engine.connect() as conn:
+            max_id = conn.execute(text(f"SELECT COALESCE(MAX(id), 0) FROM {table}")).scalar()
+        updated = 0
+        for start in range(1, max_id + 1, BATCH_SIZE):
+            with engine.begin() as conn:
+                conn.execute(text("SET LOCAL session_replication_role = replica"))
+                updated += conn.execute(text(f"""
+                    UPDATE {table} SET search_vector = {search_vector_sql(table)}
+                    WHERE id >= :start AND id < :end AND search_vector IS NULL
+                """), {'start': start, 'end': start + BATCH_SIZE}).rowcount
+        print(f"Backfilled {updated} rows of {table}")
+
+
+def create_indexes(engine):
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction block
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        for table in SEARCH_COLUMNS:
+            print(f"Creating ix_{table}_search_vector...")
+            conn.execute(text(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_{table}_search_vector ON {table} USING GIN (search_vector)"
+            ))
+
+
+def run_migration():
+    """Add, backfill and index the full-text search columns"""
+    engine = create_engine(DATABASE_URL)
+    add_columns_and_triggers(engine)
+    backfill(engine)
+    create_indexes(engine)
+    print("✅ Successfully added full-text search")
+
+
+def rollback_migration():
+    """Drop the search columns, triggers, functions and indexes"""
+    engine = create_engine(DATABASE_URL)
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        for table in SEARCH_COLUMNS:
+            print(f"Dropping ix_{table}_search_vector...")
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS ix_{table}_search_vector"))
+    with engine.begin() as conn:
+        for table in SEARCH_COLUMNS:
+            print(f"Dropping {table}.search_vector...")
+            conn.execute(text(f"DROP TRIGGER IF EXISTS {table}_search_vector ON {table}"))
+            conn.execute(text(f"DROP FUNCTION IF EXISTS relay_{table}_search_vector()"))
+            conn.execute(text(f"ALTER TABLE {table} DROP COLUMN IF EXISTS search_vector"))
+    print("✅ Successfully removed full-text search")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--rollback":
+        rollback_migration()
+    else:
+        run_migration()
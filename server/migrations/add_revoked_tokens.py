@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Migration: Add the revoked_tokens table for session token logout
+
+Date: 2025-02-24
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text
+
+# Use the same connection and model as main models
+from models import DATABASE_URL, RevokedToken
+
+engine = create_engine(DATABASE_URL)
+
+
+def run_migration():
+    """Create the revoked_tokens table"""
+    with engine.begin() as conn:
+        print("Creating revoked_tokens table...")
+        RevokedToken.__table__.create(conn, checkfirst=True)
+    print("✅ Successfully created revoked_tokens table")
+
+
+def rollback_migration():
+    """Drop the revoked_tokens table"""
+    with engine.begin() as conn:
+        print("Dropping revoked_tokens table...")
+        conn.execute(text("DROP TABLE IF EXISTS revoked_tokens"))
+    print("✅ Successfully dropped revoked_tokens table")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--rollback":
+        rollback_migration()
+    else:
+        run_migration()
@@ -0,0 +1,51 @@
+"""
+Migration: Add indexes on the columns tenant-scoped queries filter by
+Date: 2025-03-03
+"""
+
+from sqlalchemy import create_engine, text
+import sys
+import os
+
+# Add parent directory to path to import models
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import DATABASE_URL
+
+# (index name, table, column) - names match what models.py creates
+TENANT_INDEXES = [
+    ('ix_users_company_id', 'users', 'company_id'),
+    ('ix_personnels_company_id', 'personnels', 'company_id'),
+    ('ix_organizations_company_id', 'organizations', 'company_id'),
+    ('ix_projects_organization_id', 'projects', 'organization_id'),
+    ('ix_events_project_id', 'events', 'project_id'),
+    ('ix_images_event_id', 'images', 'event_id'),
+]
+
+
+def run_migration():
+    """Create the tenant indexes without blocking writes"""
+    engine = create_engine(DATABASE_URL)
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction block
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        for name, table, column in TENANT_INDEXES:
+            print(f"Creating {name}...")
+            conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({column})"))
+    print("✅ Successfully created tenant indexes")
+
+
+def rollback_migration():
+    """Drop the tenant indexes"""
+    engine = create_engine(DATABASE_URL)
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        for name, _, _ in TENANT_INDEXES:
+            print(f"Dropping {name}...")
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+    print("✅ Successfully dropped tenant indexes")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--rollback":
+        rollback_migration()
+    else:
+        run_migration()
@@ -0,0 +1,39 @@
+"""
+Migration: Add an index on users.email for login lookups
+Date: 2025-02-17
+"""
+
+from sqlalchemy import create_engine, text
+import sys
+import os
+
+# Add parent directory to path to import models
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import DATABASE_URL
+
+
+def run_migration():
+    """Create ix_users_email without blocking writes to users"""
+    engine = create_engine(DATABASE_URL)
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction block
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        print("Creating index on users.email...")
+        conn.execute(text("CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_email ON users (email)"))
+    print("✅ Successfully created ix_users_email")
+
+
+def rollback_migration():
+    """Drop ix_users_email"""
+    engine = create_engine(DATABASE_URL)
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        print("Dropping index on users.email...")
+        conn.execute(text("DROP INDEX CONCURRENTLY IF EXISTS ix_users_email"))
+    print("✅ Successfully dropped ix_users_email")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--rollback":
+        rollback_migration()
+    else:
+        run_migration()
@@ -0,0 +1,172 @@
+"""
+Migration: Partition the images table by company (PostgreSQL 14+, for DETACH PARTITION ... CONCURRENTLY)
+Date: 2025-03-05
+
+Builds images_partitioned (LIST by company_id, one partition per company plus
+one for rows without a company), copies rows over in id-range batches while
+the app keeps running, then takes a short write lock to copy whatever changed
+meanwhile (found via change_seq) and swaps the tables. Run add_change_feed.py and
+add_company_id_denormalization.py first.
+
+The partitioned table has no primary key: Postgres requires the partition key
+in every unique constraint, and company_id may be NULL. Uniqueness of id still
+comes from images_id_seq, and (id, company_id) is indexed unique.
+"""
+
+from sqlalchemy import create_engine, text
+import sys
+import os
+
+# Add parent directory to path to import models
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import DATABASE_URL, install_change_feed
+from partitions import NO_COMPANY_PARTITION, image_partition_name, images_partitioned
+
+BATCH_SIZE = 10000
+
+# (index name, columns) - created under a temporary prefix, renamed after the swap
+IMAGE_INDEXES = [
+    ('ix_images_event_id', 'event_id'),
+    ('ix_images_change_seq', 'change_seq'),
+    ('ix_images_company_id_event_id', 'company_id, event_id'),
+]
+
+FOREIGN_KEYS = """
+    ALTER TABLE {table}
+        ADD FOREIGN KEY (event_id) REFERENCES events(id) ON DELETE CASCADE,
+        ADD FOREIGN KEY (requests_id) REFERENCES shot_requests(id) ON DELETE CASCADE,
+        ADD FOREIGN KEY (company_id) REFERENCES companies(id) ON DELETE CASCADE
+"""
+
+
+def image_sequence(conn):
+    return conn.execute(text("SELECT pg_get_serial_sequence('images', 'id')")).scalar()
+
+
+def create_partitioned_table(engine):
+    """Create images_partitioned with a partition per existing company"""
+    with engine.begin() as conn:
+        print("Creating images_partitioned...")
+        conn.execute(text("DROP TABLE IF EXISTS images_partitioned"))
+        conn.execute(text(
+            "CREATE TABLE images_partitioned (LIKE images INCLUDING DEFAULTS) PARTITION BY LIST (company_id)"
+        ))
+        conn.execute(text(
+            f"CREATE TABLE {NO_COMPANY_PARTITION}_new PARTITION OF images_partitioned FOR VALUES IN (NULL)"
+        ))
+        company_ids = conn.execute(text("SELECT id FROM companies ORDER BY id")).scalars().all()
+        for company_id in company_ids:
+            conn.execute(text(
+                f"CREATE TABLE {image_partition_name(company_id)}_new "
+                f"PARTITION OF images_partitioned FOR VALUES IN ({company_id})"
+            ))
+        print(f"Created {len(company_ids)} company partitions")
+        conn.execute(text(FOREIGN_KEYS.format(table='images_partitioned')))
+        conn.execute(text(
+            "CREATE UNIQUE INDEX images_partitioned_id_company_id_key ON images_partitioned (id, company_id)"
+        ))
+        for name, columns in IMAGE_INDEXES:
+            conn.execute(text(f"CREATE INDEX {name}_new ON images_partitioned ({columns})"))
+
+
+def create_missing_partitions(conn):
+    """Partitions for companies created since create_partitioned_table (there is no default partition)"""
+    company_ids = conn.execute(text(
+        "SELECT id FROM companies WHERE to_regclass('images_company_' || id || '_new') IS NULL ORDER BY id"
+    )).scalars().all()
+    for company_id in company_ids:
+        conn.execute(text(
+            f"CREATE TABLE {image_partition_name(company_id)}_new "
+            f"PARTITION OF images_partitioned FOR VALUES IN ({company_id})"
+        ))
+
+
+def copy_rows(engine):
+    """Copy existing rows in batches; returns (highest id copied, change_seq snapshot)"""
+    with engine.connect() as conn:
+        snapshot = conn.execute(text("SELECT COALESCE(MAX(change_seq), 0) FROM images")).scalar()
+        max_id = conn.execute(text("SELECT COALESCE(MAX(id), 0) FROM images")).scalar()
+    copied = 0
+    for start in range(1, max_id + 1, BATCH_SIZE):
+        with engine.begin() as conn:
+            create_missing_partitions(conn)
+            copied += conn.execute(
+                text("INSERT INTO images_partitioned SELECT * FROM images WHERE id >= :start AND id < :end"),
+                {'start': start, 'end': min(start + BATCH_SIZE, max_id + 1)},
+            ).rowcount
+        print(f"Copied {copied} images...")
+    return max_id, snapshot
+
+
+def swap_tables(engine, max_id, snapshot):
+    """Catch up on rows written during the copy and swap the tables, under a write lock"""
+    with engine.begin() as conn:
+        conn.execute(text("LOCK TABLE images IN EXCLUSIVE MODE"))  # Reads keep working
+        conn.execute(text("LOCK TABLE companies IN SHARE MODE"))  # No new companies until the swap is done
+        create_missing_partitions(conn)
+        conn.execute(text(
+            "DELETE FROM images_partitioned p WHERE NOT EXISTS (SELECT 1 FROM images i WHERE i.id = p.id)"
+        ))
+        changed = "SELECT id FROM images WHERE change_seq > :snapshot OR id > :max_id"
+        params = {'snapshot': snapshot, 'max_id': max_id}
+        conn.execute(text(f"DELETE FROM images_partitioned WHERE id IN ({changed})"), params)
+        caught_up = conn.execute(text(
+            "INSERT INTO images_partitioned SELECT * FROM images WHERE change_seq > :snapshot OR id > :max_id"
+        ), params).rowcount
+        print(f"Caught up {caught_up} images written during the copy")
+
+        # The sequence must change owner first or dropping the old table drops it too
+        conn.execute(text(f"ALTER SEQUENCE {image_sequence(conn)} OWNED BY images_partitioned.id"))
+        conn.execute(text("DROP TABLE images"))
+        conn.execute(text("ALTER TABLE images_partitioned RENAME TO images"))
+        conn.execute(text(f"ALTER TABLE {NO_COMPANY_PARTITION}_new RENAME TO {NO_COMPANY_PARTITION}"))
+        company_ids = conn.execute(text("SELECT id FROM companies ORDER BY id")).scalars().all()
+        for company_id in company_ids:
+            name = image_partition_name(company_id)
+            conn.execute(text(f"ALTER TABLE IF EXISTS {name}_new RENAME TO {name}"))
+        conn.execute(text("ALTER INDEX images_partitioned_id_company_id_key RENAME TO images_id_company_id_key"))
+        for name, _ in IMAGE_INDEXES:
+            conn.execute(text(f"ALTER INDEX {name}_new RENAME TO {name}"))
+        install_change_feed(conn)
+
+
+def run_migration():
+    """Move images to a table partitioned by company"""
+    engine = create_engine(DATABASE_URL)
+    with engine.connect() as conn:
+        if images_partitioned(conn):
+            print("images is already partitioned")
+            return
+    create_partitioned_table(engine)
+    max_id, snapshot = copy_rows(engine)
+    swap_tables(engine, max_id, snapshot)
+    print("✅ Successfully partitioned images by company")
+
+
+def rollback_migration():
+    """Move images back to a plain table (one transaction; copies every row)"""
+    engine = create_engine(DATABASE_URL)
+    with engine.begin() as conn:
+        if not images_partitioned(conn):
+            print("images is not partitioned")
+            return
+        conn.execute(text("LOCK TABLE images IN EXCLUSIVE MODE"))
+        conn.execute(text("CREATE TABLE images_plain (LIKE images INCLUDING DEFAULTS)"))
+        copied = conn.execute(text("INSERT INTO images_plain SELECT * FROM images")).rowcount
+        conn.execute(text(f"ALTER SEQUENCE {image_sequence(conn)} OWNED BY images_plain.id"))
+        conn.execute(text("DROP TABLE images CASCADE"))  # Drops every partition
+        conn.execute(text("ALTER TABLE images_plain RENAME TO images"))
+        conn.execute(text("ALTER TABLE images ADD PRIMARY KEY (id)"))
+        conn.execute(text(FOREIGN_KEYS.format(table='images')))
+        for name, columns in IMAGE_INDEXES:
+            conn.execute(text(f"CREATE INDEX {name} ON images ({columns})"))
+        install_change_feed(conn)
+    print(f"✅ Successfully moved {copied} images back to an unpartitioned table")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--rollback":
+        rollback_migration()
+    else:
+        run_migration()
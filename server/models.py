@@ -1,9 +1,10 @@
-from sqlalchemy import Column, Integer, Float, Boolean, String, Table, ForeignKey, create_engine, DateTime
+from sqlalchemy import Column, Integer, BigInteger, Float, Boolean, String, Table, ForeignKey, Index, create_engine, DateTime, FetchedValue, event, inspect, select
 from sqlalchemy_serializer import SerializerMixin
 from werkzeug.security import check_password_hash, generate_password_hash
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship, sessionmaker
+from sqlalchemy.orm import relationship, sessionmaker, Session as OrmSession
 from datetime import datetime
+from passwords import PASSWORD_CONFIG
 
 
 Base = declarative_base()
@@ -76,13 +77,13 @@ class User(Base, SerializerMixin):
 
     id = Column(Integer, primary_key=True)
     name = Column(String, nullable=False)
-    email = Column(String, nullable=False)
+    email = Column(String, nullable=False, index=True)  # Login looks users up by email
     password_hash = Column(String, nullable=False)
     access = Column(String, nullable=False) # Admin, Client, Coordinator, Photographer, Videographer, Editor
     avatar = Column(String, default='avatar1.png') # Avatar image filename
     
     # Company relationship: many users -> one company
-    company_id = Column(Integer, ForeignKey('companies.id', ondelete='SET NULL'))
+    company_id = Column(Integer, ForeignKey('companies.id', ondelete='SET NULL'), index=True)
     company = relationship('Company', back_populates='users')
     
     # Organization relationship: many users -> one organization (scoped within company)
@@ -104,7 +105,7 @@ class User(Base, SerializerMixin):
 
     def set_password(self, password):
         """Hash and set the password"""
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = generate_password_hash(password, method=PASSWORD_CONFIG['method'])
 
     def check_password(self, password):
         """Check if the provided password matches the hash"""
@@ -115,6 +116,9 @@ class User(Base, SerializerMixin):
 
 class Events(Base, SerializerMixin):
     __tablename__ = 'events'
+    __table_args__ = (
+        Index('ix_events_company_id_date', 'company_id', 'date'),
+    )
 
     id = Column(Integer, primary_key=True)
     name = Column(String, nullable=False)
@@ -130,7 +134,13 @@ class Events(Base, SerializerMixin):
     process_point = Column(String, default='idle')
     # Column assignment for schedule (0-3 for the 4 columns)
     column_number = Column(Integer, default=0)
-    project_id = Column(Integer, ForeignKey('projects.id', ondelete='CASCADE'))
+    project_id = Column(Integer, ForeignKey('projects.id', ondelete='CASCADE'), index=True)
+    # Denormalized from project -> organization -> company, kept in sync by the flush hooks below
+    company_id = Column(Integer, ForeignKey('companies.id', ondelete='CASCADE'))
+    # Change-feed sequence, set by the database trigger on every insert/update
+    change_seq = Column(BigInteger, server_default=FetchedValue(), server_onupdate=FetchedValue(), index=True)
+    # Transaction that wrote change_seq; the feed only serves finished transactions (see ChangeFeed)
+    change_xid = Column(BigInteger, nullable=False, server_default='0', server_onupdate=FetchedValue())
 
     # Relationships
     shot_requests = relationship('ShotRequest', secondary=event_request_association_table, back_populates='events')
@@ -141,6 +151,9 @@ class Events(Base, SerializerMixin):
 
 class ShotRequest(Base, SerializerMixin):
     __tablename__ = 'shot_requests'
+    __table_args__ = (
+        Index('ix_shot_requests_company_id_process_point', 'company_id', 'process_point'),
+    )
 
     id = Column(Integer, primary_key=True)
     request = Column(String, nullable=False)
@@ -150,6 +163,12 @@ class ShotRequest(Base, SerializerMixin):
     end_time = Column(String)
     deadline = Column(String)
     process_point = Column(String, default='idle')
+    # Denormalized from the first project (or event) the request belongs to
+    company_id = Column(Integer, ForeignKey('companies.id', ondelete='CASCADE'))
+    # Change-feed sequence, set by the database trigger on every insert/update
+    change_seq = Column(BigInteger, server_default=FetchedValue(), server_onupdate=FetchedValue(), index=True)
+    # Transaction that wrote change_seq; the feed only serves finished transactions (see ChangeFeed)
+    change_xid = Column(BigInteger, nullable=False, server_default='0', server_onupdate=FetchedValue())
 
     # Relationships
     events = relationship('Events', secondary=event_request_association_table, back_populates='shot_requests')
@@ -167,9 +186,13 @@ class Personnel(Base, SerializerMixin):
     phone = Column(String)
     role = Column(String)
     avatar = Column(String)
+    # Change-feed sequence, set by the database trigger on every insert/update
+    change_seq = Column(BigInteger, server_default=FetchedValue(), server_onupdate=FetchedValue(), index=True)
+    # Transaction that wrote change_seq; the feed only serves finished transactions (see ChangeFeed)
+    change_xid = Column(BigInteger, nullable=False, server_default='0', server_onupdate=FetchedValue())
     
     # Company relationship: many personnel -> one company
-    company_id = Column(Integer, ForeignKey('companies.id', ondelete='CASCADE'))
+    company_id = Column(Integer, ForeignKey('companies.id', ondelete='CASCADE'), index=True)
     company = relationship('Company', back_populates='personnels')
     
     # Optional 1-1 link back to User
@@ -191,8 +214,12 @@ class Project(Base, SerializerMixin):
     start_date = Column(String, nullable=False)
     end_date = Column(String, nullable=False)
     deliver_date = Column(String)
+    # Change-feed sequence, set by the database trigger on every insert/update
+    change_seq = Column(BigInteger, server_default=FetchedValue(), server_onupdate=FetchedValue(), index=True)
+    # Transaction that wrote change_seq; the feed only serves finished transactions (see ChangeFeed)
+    change_xid = Column(BigInteger, nullable=False, server_default='0', server_onupdate=FetchedValue())
     # Organization relationship: many projects -> one organization
-    organization_id = Column(Integer, ForeignKey('organizations.id', ondelete='CASCADE'))
+    organization_id = Column(Integer, ForeignKey('organizations.id', ondelete='CASCADE'), index=True)
     organization = relationship('Organization', back_populates='projects')
     
     # Relationships
@@ -204,6 +231,9 @@ class Project(Base, SerializerMixin):
 class Image(Base, SerializerMixin):
 
     __tablename__ = 'images'
+    __table_args__ = (
+        Index('ix_images_company_id_event_id', 'company_id', 'event_id'),
+    )
 
     id = Column(Integer, primary_key=True)
     filename = Column(String, nullable=False)
@@ -213,9 +243,15 @@ class Image(Base, SerializerMixin):
     favorite = Column(Boolean, default=False)  # User favorite flag
     upload_date = Column(String)  # When the image was uploaded
     file_size = Column(Integer)  # File size in bytes
+    # Change-feed sequence, set by the database trigger on every insert/update
+    change_seq = Column(BigInteger, server_default=FetchedValue(), server_onupdate=FetchedValue(), index=True)
+    # Transaction that wrote change_seq; the feed only serves finished transactions (see ChangeFeed)
+    change_xid = Column(BigInteger, nullable=False, server_default='0', server_onupdate=FetchedValue())
 
-    event_id = Column(Integer, ForeignKey('events.id', ondelete='CASCADE'))
+    event_id = Column(Integer, ForeignKey('events.id', ondelete='CASCADE'), index=True)
     requests_id = Column(Integer, ForeignKey('shot_requests.id', ondelete='CASCADE'))
+    # Denormalized from the event (or shot request)
+    company_id = Column(Integer, ForeignKey('companies.id', ondelete='CASCADE'))
 
     # Relationships
     event = relationship('Events', back_populates='images')
@@ -231,7 +267,7 @@ class Organization(Base, SerializerMixin):
     details = Column(String)
     
     # Company relationship: many organizations -> one company
-    company_id = Column(Integer, ForeignKey('companies.id', ondelete='CASCADE'))
+    company_id = Column(Integer, ForeignKey('companies.id', ondelete='CASCADE'), index=True)
     company = relationship('Company', back_populates='organizations')
     
     # One organization -> many projects, many users (scoped within company)
@@ -255,6 +291,330 @@ class AccessRequest(Base):
     processed_by = Column(Integer, ForeignKey('users.id', ondelete='SET NULL'))  # Admin who processed
 
 
+class EmailOutbox(Base):
+    __tablename__ = 'email_outbox'
+
+    id = Column(Integer, primary_key=True)
+    recipient = Column(String, nullable=False)
+    subject = Column(String, nullable=False)
+    body = Column(String, nullable=False)
+    status = Column(String, nullable=False, default='pending', index=True)  # pending, sending, sent, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(String)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow)  # Backoff: not retried before this
+    claimed_at = Column(DateTime)  # When a sender picked it up (stale claims are retried)
+    sent_at = Column(DateTime)
+
+
+class RevokedToken(Base):
+    __tablename__ = 'revoked_tokens'
+
+    jti = Column(String, primary_key=True)  # Token id from the signed session token
+    expires_at = Column(DateTime, nullable=False, index=True)  # Rows can be purged after this
+
+
+class CacheVersion(Base):
+    __tablename__ = 'cache_versions'
+
+    key = Column(String, primary_key=True)  # version:<table>:<company scope> (see cache.py)
+    value = Column(BigInteger, nullable=False, default=0)
+
+
+class ChangeTombstone(Base):
+    __tablename__ = 'change_tombstones'
+
+    id = Column(Integer, primary_key=True)
+    table_name = Column(String, nullable=False)
+    row_id = Column(Integer, nullable=False)
+    company_id = Column(Integer)  # Only known for tables that carry company_id
+    change_seq = Column(BigInteger, nullable=False, index=True)
+    change_xid = Column(BigInteger, nullable=False, server_default='0')
+    deleted_at = Column(DateTime, default=datetime.utcnow)
+
+
+# Change feed
+# Every insert/update on these tables takes the next value of one shared sequence,
+# and every delete leaves a tombstone, so /api/changes can return everything after a cursor.
+# Sequence values are taken at write time, not commit time, so rows also record their
+# transaction id and the feed is ordered by (change_xid, change_seq): see ChangeFeed.
+CHANGE_FEED_TABLES = ['events', 'shot_requests', 'personnels', 'images', 'projects']
+
+# Association tables touch both parents so clients notice assignment changes
+CHANGE_FEED_ASSOCIATIONS = [
+    ('personnel_event_association', 'personnels', 'personnel_id', 'events', 'event_id'),
+    ('event_request_association', 'events', 'event_id', 'shot_requests', 'shot_request_id'),
+    ('personnel_shot_request_association', 'personnels', 'personnel_id', 'shot_requests', 'shot_request_id'),
+    ('project_requests_association', 'projects', 'project_id', 'shot_requests', 'shot_request_id'),
+    ('project_personnel_association', 'projects', 'project_id', 'personnels', 'personnel_id'),
+]
+
+
+def change_feed_ddl():
+    """PostgreSQL statements installing the change sequence, triggers and tombstones (idempotent)"""
+    statements = [
+        "CREATE SEQUENCE IF NOT EXISTS change_seq",
+        # Rows written before transaction ids were tracked count as long finished (0)
+        "ALTER TABLE change_tombstones ADD COLUMN IF NOT EXISTS change_xid BIGINT NOT NULL DEFAULT 0",
+        """
+        CREATE OR REPLACE FUNCTION relay_touch_change_seq() RETURNS trigger AS $$
+        BEGIN
+            NEW.change_seq := nextval('change_seq');
+            NEW.change_xid := pg_current_xact_id()::text::bigint;
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        """
+        CREATE OR REPLACE FUNCTION relay_record_tombstone() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO change_tombstones (table_name, row_id, company_id, change_seq, change_xid, deleted_at)
+            -- The table name is passed explicitly: on a partitioned table TG_TABLE_NAME is the partition
+            VALUES (COALESCE(TG_ARGV[0], TG_TABLE_NAME), OLD.id, (to_jsonb(OLD)->>'company_id')::integer,
+                    nextval('change_seq'), pg_current_xact_id()::text::bigint, now());
+            RETURN OLD;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        """
+        CREATE OR REPLACE FUNCTION relay_touch_association() RETURNS trigger AS $$
+        DECLARE
+            row_data jsonb;
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                row_data := to_jsonb(OLD);
+            ELSE
+                row_data := to_jsonb(NEW);
+            END IF;
+            EXECUTE 'UPDATE ' || quote_ident(TG_ARGV[0]) || ' SET change_seq = 0 WHERE id = $1'
+                USING (row_data->>TG_ARGV[1])::integer;
+            EXECUTE 'UPDATE ' || quote_ident(TG_ARGV[2]) || ' SET change_seq = 0 WHERE id = $1'
+                USING (row_data->>TG_ARGV[3])::integer;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+    ]
+    for table in CHANGE_FEED_TABLES:
+        statements += [
+            f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS change_seq BIGINT",
+            f"CREATE INDEX IF NOT EXISTS ix_{table}_change_seq ON {table} (change_seq)",
+            f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS change_xid BIGINT NOT NULL DEFAULT 0",
+            f"CREATE INDEX IF NOT EXISTS ix_{table}_change_xid_seq ON {table} (change_xid, change_seq)",
+            f"DROP TRIGGER IF EXISTS {table}_change_seq ON {table}",
+            f"CREATE TRIGGER {table}_change_seq BEFORE INSERT OR UPDATE ON {table} "
+            f"FOR EACH ROW EXECUTE FUNCTION relay_touch_change_seq()",
+            f"DROP TRIGGER IF EXISTS {table}_tombstone ON {table}",
+            f"CREATE TRIGGER {table}_tombstone AFTER DELETE ON {table} "
+            f"FOR EACH ROW EXECUTE FUNCTION relay_record_tombstone('{table}')",
+        ]
+    for table, left, left_column, right, right_column in CHANGE_FEED_ASSOCIATIONS:
+        statements += [
+            f"DROP TRIGGER IF EXISTS {table}_touch ON {table}",
+            f"CREATE TRIGGER {table}_touch AFTER INSERT OR DELETE ON {table} "
+            f"FOR EACH ROW EXECUTE FUNCTION relay_touch_association('{left}', '{left_column}', '{right}', '{right_column}')",
+        ]
+    return statements
+
+
+def install_change_feed(connection):
+    """Install the change feed triggers on an existing connection"""
+    for statement in change_feed_ddl():
+        # exec_driver_sql: the plpgsql bodies must reach the driver untouched
+        connection.exec_driver_sql(statement)
+
+
+@event.listens_for(Base.metadata, 'after_create')
+def _install_change_feed_after_create(target, connection, **kw):
+    if connection.dialect.name == 'postgresql':
+        install_change_feed(connection)
+
+
+# Full-text search
+# A search_vector tsvector column, kept current by a trigger that only fires when one
+# of the indexed columns changes, and a GIN index per table. The column is not mapped:
+# only /api/search reads it.
+SEARCH_LANGUAGE = 'english'
+
+# Indexed columns per table with their ts_rank weight (A ranks highest)
+SEARCH_COLUMNS = {
+    'events': [('name', 'A'), ('location', 'B'), ('notes', 'C')],
+    'shot_requests': [('request', 'A'), ('notes', 'C')],
+    'personnels': [('name', 'A'), ('role', 'B')],
+    'projects': [('name', 'A'), ('location', 'B')],
+}
+
+
+def search_vector_sql(table, row=None):
+    """tsvector expression over a table's indexed columns (of `row`, e.g. NEW, if given)"""
+    prefix = f'{row}.' if row else ''
+    return ' || '.join(
+        f"setweight(to_tsvector('{SEARCH_LANGUAGE}', coalesce({prefix}{column}, '')), '{weight}')"
+        for column, weight in SEARCH_COLUMNS[table]
+    )
+
+
+def search_ddl(indexes=True):
+    """PostgreSQL statements installing the search columns, triggers and GIN indexes (idempotent)"""
+    statements = []
+    for table, columns in SEARCH_COLUMNS.items():
+        statements += [
+            f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector",
+            f"""
+            CREATE OR REPLACE FUNCTION relay_{table}_search_vector() RETURNS trigger AS $$
+            BEGIN
+                NEW.search_vector := {search_vector_sql(table, 'NEW')};
+                RETURN NEW;
+            END;
+            $$ LANGUAGE plpgsql
+            """,
+            f"DROP TRIGGER IF EXISTS {table}_search_vector ON {table}",
+            f"CREATE TRIGGER {table}_search_vector BEFORE INSERT OR UPDATE OF "
+            f"{', '.join(column for column, _ in columns)} ON {table} "
+            f"FOR EACH ROW EXECUTE FUNCTION relay_{table}_search_vector()",
+        ]
+        if indexes:
+            statements.append(f"CREATE INDEX IF NOT EXISTS ix_{table}_search_vector ON {table} USING GIN (search_vector)")
+    return statements
+
+
+def install_search(connection):
+    """Install the full-text search columns and triggers on an existing connection"""
+    for statement in search_ddl():
+        connection.exec_driver_sql(statement)
+
+
+@event.listens_for(Base.metadata, 'after_create')
+def _install_search_after_create(target, connection, **kw):
+    if connection.dialect.name == 'postgresql':
+        install_search(connection)
+
+
+# Denormalized company_id
+# Events, shot requests and images carry their company so tenant-scoped queries
+# don't need to join through projects and organizations. It is derived here on
+# every flush, and pushed down to child rows when a parent changes company.
+# Events and shot requests without a project (or event) to derive it from get
+# the default company; tenancy.py makes that the company of the request.
+
+_default_company = None
+
+
+def set_default_company(resolver):
+    """Register a callable returning the company_id for rows with no parent, or None"""
+    global _default_company
+    _default_company = resolver
+
+
+def _fallback_company():
+    return _default_company() if _default_company is not None else None
+
+def _changed(obj, attr):
+    return inspect(obj).attrs[attr].history.has_changes()
+
+
+def _project_company(session, project_id, memo):
+    if project_id is None:
+        return None
+    if ('projects', project_id) not in memo:
+        memo[('projects', project_id)] = session.execute(
+            select(Organization.company_id)
+            .join(Project, Project.organization_id == Organization.id)
+            .where(Project.id == project_id)
+        ).scalar()
+    return memo[('projects', project_id)]
+
+
+def _row_company(session, model, row_id, memo):
+    if row_id is None:
+        return None
+    key = (model.__tablename__, row_id)
+    if key not in memo:
+        memo[key] = session.execute(select(model.company_id).where(model.id == row_id)).scalar()
+    return memo[key]
+
+
+def _shot_request_company(session, shot_request, memo):
+    for project in shot_request.projects:
+        company_id = _row_company(session, Organization, project.organization_id, memo)
+        if company_id is not None:
+            return company_id
+    for event in shot_request.events:
+        if event.company_id is not None:
+            return event.company_id
+    if not shot_request.projects and not shot_request.events:
+        return _fallback_company()
+    return None
+
+
+def _needs_company(obj, *parents):
+    """company_id is missing, was written directly, or one of its parents changed"""
+    return obj.company_id is None or any(_changed(obj, attr) for attr in ('company_id',) + parents)
+
+
+def _event_company(session, event, memo):
+    # A project assigned through the relationship hasn't synced project_id yet
+    if _changed(event, 'project') and event.project is not None:
+        project = event.project
+        if project.organization is not None:
+            return project.organization.company_id
+        return _row_company(session, Organization, project.organization_id, memo)
+    if event.project_id is None and event.project is None:
+        return _fallback_company()
+    return _project_company(session, event.project_id, memo)
+
+
+def _image_company(session, image, memo):
+    if _changed(image, 'event') and image.event is not None:
+        return image.event.company_id
+    if image.event_id is not None:
+        return _row_company(session, Events, image.event_id, memo)
+    if _changed(image, 'shot_request') and image.shot_request is not None:
+        return image.shot_request.company_id
+    return _row_company(session, ShotRequest, image.requests_id, memo)
+
+
+@event.listens_for(OrmSession, 'before_flush')
+def _assign_company_ids(session, flush_context, instances):
+    memo = {}
+    pending = list(session.new) + list(session.dirty)
+    with session.no_autoflush:
+        # Parents first, so images of a new event in the same flush see its company
+        for obj in pending:
+            if isinstance(obj, Events) and _needs_company(obj, 'project_id', 'project'):
+                obj.company_id = _event_company(session, obj, memo)
+        for obj in pending:
+            if isinstance(obj, ShotRequest) and _needs_company(obj, 'projects', 'events'):
+                obj.company_id = _shot_request_company(session, obj, memo)
+        for obj in pending:
+            if isinstance(obj, Image) and _needs_company(obj, 'event_id', 'event', 'requests_id', 'shot_request'):
+                obj.company_id = _image_company(session, obj, memo)
+
+
+@event.listens_for(OrmSession, 'after_flush')
+def _propagate_company_ids(session, flush_context):
+    """Push a company change down to rows that copy it"""
+    events_table, images_table = Events.__table__, Image.__table__
+    for obj in session.dirty:
+        if isinstance(obj, Organization) and _changed(obj, 'company_id'):
+            project_ids = select(Project.id).where(Project.organization_id == obj.id)
+            session.execute(events_table.update().where(events_table.c.project_id.in_(project_ids))
+                            .values(company_id=obj.company_id))
+            event_ids = select(events_table.c.id).where(events_table.c.project_id.in_(project_ids))
+            session.execute(images_table.update().where(images_table.c.event_id.in_(event_ids))
+                            .values(company_id=obj.company_id))
+        elif isinstance(obj, Project) and _changed(obj, 'organization_id'):
+            company_id = session.execute(
+                select(Organization.company_id).where(Organization.id == obj.organization_id)
+            ).scalar()
+            session.execute(events_table.update().where(events_table.c.project_id == obj.id)
+                            .values(company_id=company_id))
+            event_ids = select(events_table.c.id).where(events_table.c.project_id == obj.id)
+            session.execute(images_table.update().where(images_table.c.event_id.in_(event_ids))
+                            .values(company_id=company_id))
+        elif isinstance(obj, Events) and _changed(obj, 'company_id'):
+            session.execute(images_table.update().where(images_table.c.event_id == obj.id)
+                            .values(company_id=obj.company_id))
 
 
 # Database initialization
@@ -0,0 +1,123 @@
+"""
+Optional partitioned layout for the images table.
+
+images grows far faster than anything else, and both per-event galleries and
+company cleanup hit it hard. After migrations/partition_images.py it is a
+Postgres table LIST-partitioned by company_id:
+
+    images                      (partitioned parent)
+    ├── images_company_<id>     one partition per company
+    └── images_no_company       rows without a company (FOR VALUES IN (NULL))
+
+Tenant-scoped queries filter on company_id, so the planner prunes them to one
+partition. Deleting a company detaches its partition first, deletes the rest of
+the company, and drops the partition once that has committed, instead of
+deleting its images row by row. (Hash partitioning spreads rows just as well
+but mixes several companies in each partition, so a company could not be
+dropped as a unit.) There is deliberately no DEFAULT partition: Postgres
+refuses DETACH PARTITION ... CONCURRENTLY on a table that has one.
+
+A partition is created in the same transaction as its company. On SQLite or an
+unpartitioned images table every helper here is a no-op.
+"""
+
+from sqlalchemy import event, text
+
+from models import Company
+
+
+NO_COMPANY_PARTITION = 'images_no_company'
+
+
+def image_partition_name(company_id):
+    return f'images_company_{int(company_id)}'
+
+
+def images_partitioned(connection):
+    """True when images is a partitioned table in this database"""
+    if connection.dialect.name != 'postgresql':
+        return False
+    return connection.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('images'))"
+    )).scalar()
+
+
+def create_image_partition(connection, company_id):
+    """Create the images partition of a company"""
+    connection.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {image_partition_name(company_id)} "
+        f"PARTITION OF images FOR VALUES IN ({int(company_id)})"
+    ))
+
+
+def _detached(connection, name):
+    """True when the partition exists as a standalone table"""
+    return connection.execute(text(
+        "SELECT to_regclass(:name) IS NOT NULL "
+        "AND NOT EXISTS (SELECT 1 FROM pg_inherits WHERE inhrelid = to_regclass(:name))"
+    ), {'name': name}).scalar()
+
+
+def detach_image_partition(engine, company_id):
+    """Detach a company's images partition; returns the approximate number of images in it
+
+    Returns None when images is unpartitioned. DETACH ... CONCURRENTLY only
+    blocks writes to that one partition, but can't run inside a transaction, so
+    this runs on its own autocommit connection and must be called before the
+    caller's transaction touches images. The detached table keeps the parent's
+    foreign keys as its own; they are dropped too, so deleting the company's
+    events doesn't cascade into it row by row. The count is the planner's
+    estimate from pg_class.reltuples rather than a scan of the partition.
+    """
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        if not images_partitioned(connection):
+            return None
+        name = image_partition_name(company_id)
+        row = connection.execute(text(
+            "SELECT c.reltuples, i.inhdetachpending FROM pg_class c "
+            "LEFT JOIN pg_inherits i ON i.inhrelid = c.oid WHERE c.oid = to_regclass(:name)"
+        ), {'name': name}).first()
+        if row is None:
+            return 0
+        estimate, detach_pending = row
+        if detach_pending:
+            # An earlier concurrent detach was interrupted half way
+            connection.execute(text(f"ALTER TABLE images DETACH PARTITION {name} FINALIZE"))
+        elif detach_pending is not None:
+            connection.execute(text(f"ALTER TABLE images DETACH PARTITION {name} CONCURRENTLY"))
+        # Otherwise an earlier deletion detached it and failed before dropping it
+        foreign_keys = connection.execute(text(
+            "SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(:name) AND contype = 'f'"
+        ), {'name': name}).scalars().all()
+        for constraint in foreign_keys:
+            connection.execute(text(f'ALTER TABLE {name} DROP CONSTRAINT "{constraint}"'))
+        return max(int(estimate), 0)  # -1 until the partition has been analyzed
+
+
+def attach_image_partition(engine, company_id):
+    """Put back a partition detached by detach_image_partition, e.g. when the company's deletion failed
+
+    Attaching re-creates the parent's foreign keys and validates the rows
+    against them, so this scans the partition.
+    """
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        name = image_partition_name(company_id)
+        if connection.dialect.name == 'postgresql' and _detached(connection, name):
+            connection.execute(text(
+                f"ALTER TABLE images ATTACH PARTITION {name} FOR VALUES IN ({int(company_id)})"
+            ))
+
+
+def drop_image_partition(engine, company_id):
+    """Drop a partition detached by detach_image_partition once the company's deletion has committed"""
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        name = image_partition_name(company_id)
+        if connection.dialect.name == 'postgresql' and _detached(connection, name):
+            # Dropping skips the row-level tombstone trigger; the company's change feed goes with it
+            connection.execute(text(f"DROP TABLE {name}"))
+
+
+@event.listens_for(Company, 'after_insert')
+def _create_company_partition(mapper, connection, target):
+    if images_partitioned(connection):
+        create_image_partition(connection, target.id)
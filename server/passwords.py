@@ -0,0 +1,131 @@
+"""
+Password hashing and verification off the request thread.
+
+werkzeug's KDFs (scrypt, pbkdf2) run inside OpenSSL with the GIL released, so
+a thread pool is enough to keep them from starving the request threads. The
+pool is bounded: when more than `max_pending` checks are already waiting, new
+ones are rejected with PasswordPoolBusy instead of piling up behind a login
+spike.
+
+The KDF is configurable with RELAY_PASSWORD_METHOD (any werkzeug method string,
+e.g. "scrypt:32768:8:1" or "pbkdf2:sha256:600000"). Hashes made with other
+parameters still verify and are rehashed on the next successful login.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+# Password hashing configuration
+PASSWORD_CONFIG = {
+    'method': os.getenv('RELAY_PASSWORD_METHOD', 'scrypt:32768:8:1'),
+    'workers': int(os.getenv('RELAY_PASSWORD_WORKERS', str(min(4, os.cpu_count() or 1)))),
+    'max_pending': int(os.getenv('RELAY_PASSWORD_MAX_PENDING', '64')),  # Queued + running checks
+    'timeout': float(os.getenv('RELAY_PASSWORD_TIMEOUT', '10')),  # Seconds a request waits for its check
+}
+
+
+class PasswordPoolBusy(Exception):
+    """Raised when the password pool already has max_pending jobs"""
+
+
+class PasswordPool:
+    """Bounded thread pool for KDF work, with queue-depth counters"""
+
+    def __init__(self, workers, max_pending):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self.pending = 0  # Submitted and not finished (queued + running)
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def _run(self, func, args):
+        with self._lock:
+            self.running += 1
+        try:
+            return func(*args)
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.pending -= 1
+                self.completed += 1
+            self._slots.release()
+
+    def submit(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise PasswordPoolBusy('Too many password checks in progress, try again shortly')
+        with self._lock:
+            self.pending += 1
+        return self._executor.submit(self._run, func, args)
+
+    def run(self, func, *args, timeout=None):
+        return self.submit(func, *args).result(timeout=timeout)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'max_pending': self.max_pending,
+                'queue_depth': self.pending - self.running,
+                'running': self.running,
+                'completed': self.completed,
+                'rejected': self.rejected,
+            }
+
+
+password_pool = PasswordPool(PASSWORD_CONFIG['workers'], PASSWORD_CONFIG['max_pending'])
+
+
+def _generate(password):
+    return generate_password_hash(password, method=PASSWORD_CONFIG['method'])
+
+
+def hash_password(password):
+    """Hash one password on the pool with the configured KDF"""
+    return password_pool.run(_generate, password, timeout=PASSWORD_CONFIG['timeout'])
+
+
+def hash_passwords(passwords):
+    """Hash a list of passwords on the pool, preserving order
+
+    Submitted one pool-width at a time so a large batch can't fill the queue
+    and lock out logins.
+    """
+    hashes = []
+    for start in range(0, len(passwords), password_pool.workers):
+        futures = [
+            password_pool.submit(_generate, password)
+            for password in passwords[start:start + password_pool.workers]
+        ]
+        hashes += [future.result(timeout=PASSWORD_CONFIG['timeout']) for future in futures]
+    return hashes
+
+
+def verify_password(password_hash, password):
+    """Check a password against its hash on the pool"""
+    return password_pool.run(check_password_hash, password_hash, password, timeout=PASSWORD_CONFIG['timeout'])
+
+
+_method_prefix = None
+
+
+def _configured_prefix():
+    """Method prefix werkzeug writes for the configured method (e.g. pbkdf2 -> pbkdf2:sha256:1000000)"""
+    global _method_prefix
+    if _method_prefix is None:
+        _method_prefix = generate_password_hash('', method=PASSWORD_CONFIG['method']).split('$', 1)[0]
+    return _method_prefix
+
+
+def needs_rehash(password_hash):
+    """True when a hash was made with different KDF parameters than the configured ones"""
+    return password_hash.split('$', 1)[0] != _configured_prefix()
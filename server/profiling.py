@@ -0,0 +1,178 @@
+"""
+Opt-in request profiling and SQL instrumentation.
+
+With RELAY_PROFILING=1 every request records its wall time, time spent in the
+database, statement count and slowest statements (from SQLAlchemy's
+before/after_cursor_execute events). They are returned as a Server-Timing
+header, which browser dev tools show next to the request, and printed as one
+JSON log line per request:
+
+    Server-Timing: app;dur=84.2, db;dur=61.0;desc="14 queries"
+
+A full Python profile can be captured on top of that:
+- for endpoints listed in RELAY_PROFILE_ENDPOINTS (e.g. "eventsresource,personnelresource"),
+  sampled at RELAY_PROFILE_SAMPLE (0-1, default 1)
+- for a single request sent with `X-Relay-Profile: 1` by a super admin
+
+cProfile is used unless RELAY_PROFILER=pyinstrument and pyinstrument is
+installed. Profiles are written to RELAY_PROFILE_DIR (one file per request)
+and the top functions are logged.
+"""
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import random
+import time
+from datetime import datetime
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+from tokens import current_claims
+
+try:
+    import pyinstrument
+except ImportError:  # Optional
+    pyinstrument = None
+
+
+# Profiling configuration
+PROFILING_CONFIG = {
+    'enabled': os.getenv('RELAY_PROFILING', '0') == '1',
+    'endpoints': {e.strip() for e in os.getenv('RELAY_PROFILE_ENDPOINTS', '').split(',') if e.strip()},
+    'sample_rate': float(os.getenv('RELAY_PROFILE_SAMPLE', '1')),
+    'profiler': os.getenv('RELAY_PROFILER', 'cprofile'),  # cprofile or pyinstrument
+    'profile_dir': os.getenv('RELAY_PROFILE_DIR', 'profiles'),
+    'header': 'X-Relay-Profile',
+    'slowest_statements': 3,  # Statements kept per request for the log line
+    'top_functions': 15,  # cProfile functions logged per profiled request
+}
+
+
+# SQL instrumentation
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        context._relay_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_relay_started', None)
+    if started is None or not has_request_context() or 'sql_stats' not in g:
+        return
+    elapsed = time.perf_counter() - started
+    stats = g.sql_stats
+    stats['count'] += 1
+    stats['time'] += elapsed
+    slowest = stats['slowest']
+    if len(slowest) < PROFILING_CONFIG['slowest_statements'] or elapsed > slowest[-1][0]:
+        slowest.append((elapsed, ' '.join(statement.split())[:500]))
+        slowest.sort(key=lambda item: item[0], reverse=True)
+        del slowest[PROFILING_CONFIG['slowest_statements']:]
+
+
+def request_sql_stats():
+    """SQL count and time recorded for the current request, or None when profiling is off"""
+    return g.get('sql_stats') if has_request_context() else None
+
+
+# Python profilers
+
+def _wants_profile():
+    if request.headers.get(PROFILING_CONFIG['header']) == '1':
+        claims = current_claims()
+        return bool(claims and claims.get('sa'))
+    return request.endpoint in PROFILING_CONFIG['endpoints'] and random.random() < PROFILING_CONFIG['sample_rate']
+
+
+def _start_profiler():
+    if PROFILING_CONFIG['profiler'] == 'pyinstrument' and pyinstrument is not None:
+        profiler = pyinstrument.Profiler()
+        profiler.start()
+    else:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            return None  # Another request on this process is being profiled (Python 3.12+ allows one)
+    return profiler
+
+
+def _save_profile(profiler):
+    """Stop the profiler, write it to the profile directory and return the log summary"""
+    os.makedirs(PROFILING_CONFIG['profile_dir'], exist_ok=True)
+    name = f"{datetime.utcnow():%Y%m%dT%H%M%S%f}-{request.endpoint}"
+    path = os.path.join(PROFILING_CONFIG['profile_dir'], name)
+
+    if isinstance(profiler, cProfile.Profile):
+        profiler.disable()
+        profiler.dump_stats(path + '.prof')  # Open with snakeviz or pstats
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(PROFILING_CONFIG['top_functions'])
+        top = output.getvalue().strip().splitlines()[-PROFILING_CONFIG['top_functions']:]
+        return {'profile': path + '.prof', 'top': top}
+
+    profiler.stop()
+    with open(path + '.html', 'w') as f:
+        f.write(profiler.output_html())
+    return {'profile': path + '.html'}
+
+
+def init_profiling(app, engine):
+    """Register the request timing hooks and SQL listeners when RELAY_PROFILING=1"""
+    if not PROFILING_CONFIG['enabled']:
+        return
+
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+    @app.before_request
+    def _start_timing():
+        g.request_started = time.perf_counter()
+        g.sql_stats = {'count': 0, 'time': 0.0, 'slowest': []}
+        g.profiler = _start_profiler() if _wants_profile() else None
+
+    @app.after_request
+    def _finish_timing(response):
+        if 'request_started' not in g:
+            return response
+        profile = None
+        if g.get('profiler') is not None:
+            profile = _save_profile(g.profiler)
+            g.profiler = None
+        total_ms = (time.perf_counter() - g.request_started) * 1000
+        stats = g.sql_stats
+        db_ms = stats['time'] * 1000
+
+        response.headers.add(
+            'Server-Timing',
+            f'app;dur={total_ms:.1f}, db;dur={db_ms:.1f};desc="{stats["count"]} queries"',
+        )
+        response.headers['Timing-Allow-Origin'] = '*'  # Let the cross-origin client see it
+        record = {
+            'type': 'request_timing',
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'duration_ms': round(total_ms, 1),
+            'db_ms': round(db_ms, 1),
+            'statements': stats['count'],
+            'slowest': [{'ms': round(elapsed * 1000, 1), 'sql': sql} for elapsed, sql in stats['slowest']],
+        }
+        if profile:
+            record.update(profile)
+        print(json.dumps(record))
+        return response
+
+    @app.teardown_request
+    def _stop_profiler(exc):
+        # A request that failed before after_request must not leave its profiler running
+        profiler = g.pop('profiler', None)
+        if isinstance(profiler, cProfile.Profile):
+            profiler.disable()
+        elif profiler is not None:
+            profiler.stop()
@@ -0,0 +1,85 @@
+"""
+Column projections for the list endpoints.
+
+A list GET that loads full ORM instances pays for every column, the identity
+map and instance state only to copy a handful of attributes into dicts. A
+Projection names the columns a resource returns once; list endpoints select
+just those columns and turn each row straight into a dict, and single-object
+endpoints build the same dict from an instance they already hold.
+
+The columns are ORM attributes and are run through the Session, so the tenant
+criteria from tenancy.py still apply to these reads.
+"""
+
+from sqlalchemy import select
+
+from models import User, Project, Events, Personnel, personnel_event_association_table
+
+
+class Projection:
+    """Ordered {field: column} mapping shared by a resource's list and detail payloads"""
+
+    def __init__(self, **columns):
+        self.columns = columns
+
+    def select(self):
+        return select(*(column.label(field) for field, column in self.columns.items()))
+
+    def rows(self, session, statement):
+        """Run a select built from self.select() and return one dict per row"""
+        return [dict(row) for row in session.execute(statement).mappings()]
+
+    def dump(self, obj):
+        """The same payload from a loaded instance"""
+        return {field: getattr(obj, column.key) for field, column in self.columns.items()}
+
+
+USER_FIELDS = Projection(
+    id=User.id,
+    name=User.name,
+    email=User.email,
+    access=User.access,
+    avatar=User.avatar,
+    organization_id=User.organization_id,
+    company_id=User.company_id,
+)
+
+PROJECT_FIELDS = Projection(
+    id=Project.id,
+    name=Project.name,
+    location=Project.location,
+    start_date=Project.start_date,
+    end_date=Project.end_date,
+    deliver_date=Project.deliver_date,
+    organization_id=Project.organization_id,
+)
+
+EVENT_FIELDS = Projection(
+    id=Events.id,
+    name=Events.name,
+    date=Events.date,
+    start_time=Events.start_time,
+    end_time=Events.end_time,
+    location=Events.location,
+    notes=Events.notes,
+    quick_turn=Events.quick_turn,
+    deadline=Events.deadline,
+    process_point=Events.process_point,
+    column_number=Events.column_number,
+    project_id=Events.project_id,
+)
+
+
+def assigned_personnel(session, event_ids=None):
+    """{event_id: [{'personnel_id', 'name', 'role'}]} in one query instead of one per event"""
+    association = personnel_event_association_table
+    statement = (
+        select(association.c.event_id, Personnel.id, Personnel.name, Personnel.role)
+        .join(Personnel, Personnel.id == association.c.personnel_id)
+    )
+    if event_ids is not None:
+        statement = statement.where(association.c.event_id.in_(event_ids))
+    assigned = {}
+    for event_id, personnel_id, name, role in session.execute(statement):
+        assigned.setdefault(event_id, []).append({'personnel_id': personnel_id, 'name': name, 'role': role})
+    return assigned
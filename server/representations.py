@@ -0,0 +1,86 @@
+"""
+JSON representation for the flask-restful Api.
+
+flask-restful encodes every resource result with the stdlib json module, which
+is a large share of the CPU time of /api/events or /api/images at thousands of
+rows. This representation encodes with orjson when it is installed (several
+times faster, and it serializes datetime/date/UUID natively) and falls back to
+json otherwise, or for values orjson refuses such as integers over 64 bits.
+
+Lists longer than RELAY_JSON_STREAM_ITEMS are streamed a chunk of items at a
+time instead of being built into one string, which keeps peak memory flat for
+very large responses. RELAY_JSON=json forces the stdlib encoder, e.g. to
+compare the two with benchmark.py.
+"""
+
+import datetime
+import json
+import os
+import uuid
+
+from flask import current_app, stream_with_context
+
+try:
+    import orjson
+except ImportError:  # Optional
+    orjson = None
+
+
+# Serializer configuration
+JSON_CONFIG = {
+    'encoder': os.getenv('RELAY_JSON', 'orjson'),  # orjson or json
+    'stream_items': int(os.getenv('RELAY_JSON_STREAM_ITEMS', '5000')),  # 0 never streams
+    'chunk_items': 1000,  # Items encoded per streamed chunk
+}
+
+
+def _default(value):
+    """Types the stdlib encoder doesn't know (orjson handles these itself)"""
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def dumps(data):
+    """Encode data to JSON bytes with the configured encoder"""
+    if orjson is not None and JSON_CONFIG['encoder'] == 'orjson':
+        option = orjson.OPT_NON_STR_KEYS
+        if current_app.debug:
+            option |= orjson.OPT_INDENT_2  # Readable in debug, as flask-restful does
+        try:
+            return orjson.dumps(data, default=_default, option=option)
+        except (orjson.JSONEncodeError, TypeError):
+            pass  # e.g. an int beyond 64 bits: let json decide
+    settings = dict(current_app.config.get('RESTFUL_JSON', {}))
+    if current_app.debug:
+        settings.setdefault('indent', 4)
+    return json.dumps(data, default=_default, **settings).encode()
+
+
+def _stream_list(items):
+    """Yield a JSON array a chunk of items at a time"""
+    chunk_items = JSON_CONFIG['chunk_items']
+    yield b'['
+    for start in range(0, len(items), chunk_items):
+        if start:
+            yield b','
+        yield dumps(items[start:start + chunk_items]).strip()[1:-1]
+    yield b']\n'
+
+
+def output_json(data, code, headers=None):
+    """Makes a Flask response with a JSON encoded body (replaces flask-restful's)"""
+    stream_items = JSON_CONFIG['stream_items']
+    if stream_items and isinstance(data, list) and len(data) > stream_items:
+        body = stream_with_context(_stream_list(data))  # dumps needs the app while the body is sent
+        response = current_app.response_class(body, status=code, mimetype='application/json')
+    else:
+        response = current_app.response_class(dumps(data) + b'\n', status=code, mimetype='application/json')
+    response.headers.extend(headers or {})
+    return response
+
+
+def init_json_representation(api):
+    api.representation('application/json')(output_json)
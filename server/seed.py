@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+"""
+Synthetic multi-tenant dataset for local load testing and benchmarks.
+
+Generates companies, organizations, projects, events, personnel (with event
+and project assignments), shot requests and images, and loads them with
+Postgres COPY. Ids are assigned here, so association rows never wait on
+RETURNING, and every value comes from one random.Random(seed): the same seed
+and scale always produce the same dataset.
+
+Tenants are deliberately uneven (company n gets roughly 1/n of the rows), like
+production, where a few large customers own most of the data.
+
+Usage:
+    python seed.py --reset --scale medium            # ~100k events, ~1M images
+    python seed.py --reset --scale large --seed 7
+    python seed.py --scale small --events 5000       # override one count
+
+Companies, events, shot requests and images are totals (the last three split
+unevenly across companies); organizations and personnel are per company, and
+projects per organization.
+
+Each company gets an admin user admin@company<N>.test (password: --password)
+so benchmarks can log in as a tenant.
+
+COPY runs with session_replication_role = replica, so the change feed, search
+and association triggers don't fire once per row (nor do foreign key checks:
+the generated rows are consistent by construction). change_seq and the search
+vectors are then filled in with one UPDATE per table. Setting the role needs a
+superuser.
+"""
+
+import argparse
+import csv
+import io
+import random
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import text
+from werkzeug.security import generate_password_hash
+
+from models import init_db, CHANGE_FEED_TABLES, SEARCH_COLUMNS, search_vector_sql
+from partitions import create_image_partition, images_partitioned
+
+
+SCALES = {
+    'small': {
+        'companies': 3, 'organizations': 2, 'projects': 5, 'personnel': 20,
+        'events': 2000, 'shot_requests': 1000, 'images': 50000,
+    },
+    'medium': {
+        'companies': 10, 'organizations': 3, 'projects': 10, 'personnel': 50,
+        'events': 100000, 'shot_requests': 20000, 'images': 1000000,
+    },
+    'large': {
+        'companies': 25, 'organizations': 4, 'projects': 20, 'personnel': 100,
+        'events': 500000, 'shot_requests': 100000, 'images': 5000000,
+    },
+}
+
+# What each count means (the --<name> overrides use the same units)
+COUNT_UNITS = {
+    'companies': 'total',
+    'organizations': 'per company',
+    'projects': 'per organization',
+    'personnel': 'per company',
+    'events': 'total, split unevenly across companies',
+    'shot_requests': 'total, split unevenly across companies',
+    'images': 'total, split unevenly across companies',
+}
+
+COPY_CHUNK = 100000  # Rows buffered per COPY
+
+# Tables loaded by the seed, in dependency order
+SEEDED_TABLES = [
+    'companies', 'users', 'organizations', 'personnels', 'projects', 'events', 'shot_requests', 'images',
+    'personnel_event_association', 'event_request_association', 'project_requests_association',
+    'project_personnel_association', 'personnel_shot_request_association',
+]
+
+WORDS = [
+    'Aurora', 'Harbor', 'Summit', 'Cedar', 'Canyon', 'Atlas', 'Lumen', 'Meridian', 'Sierra', 'Coastal',
+    'Evergreen', 'Granite', 'Horizon', 'Juniper', 'Maple', 'Orchid', 'Pioneer', 'Redwood', 'Willow', 'Vista',
+]
+EVENT_KINDS = [
+    'Keynote', 'Panel', 'Workshop', 'Headliner Set', 'Opening Ceremony', 'Press Conference',
+    'Awards Dinner', 'Soundcheck', 'Meet & Greet', 'Red Carpet', 'Afterparty', 'Product Demo',
+]
+LOCATIONS = ['Main Stage', 'Hall A', 'Hall B', 'Ballroom', 'Pavilion', 'Rooftop', 'Studio 3', 'Lobby']
+SHOTS = [
+    'Wide of the crowd', 'Speaker close-up', 'Sponsor signage', 'Candid backstage', 'Stage from balcony',
+    'Group photo', 'Detail shots of decor', 'Product on table', 'VIP arrivals', 'Performer portrait',
+]
+FIRST_NAMES = ['Alex', 'Sam', 'Jordan', 'Taylor', 'Morgan', 'Casey', 'Riley', 'Jamie', 'Avery', 'Quinn']
+LAST_NAMES = ['Rivera', 'Chen', 'Patel', 'Okafor', 'Novak', 'Silva', 'Kim', 'Haddad', 'Larsen', 'Moreau']
+ROLES = ['Photographer', 'Videographer', 'Editor', 'Coordinator']
+PROCESS_POINTS = ['idle', 'ingest', 'cull', 'color', 'delivered']
+PROCESS_WEIGHTS = [40, 15, 15, 10, 20]
+
+
+def tenant_weights(companies):
+    """Zipf-like share of rows per company"""
+    return [1 / (n + 1) for n in range(companies)]
+
+
+def split(total, weights, rng):
+    """Distribute total rows over buckets by weight (at least one each when possible)"""
+    floor = 1 if total >= len(weights) else 0
+    scale = (total - floor * len(weights)) / sum(weights)
+    counts = [floor + int(w * scale) for w in weights]
+    for _ in range(total - sum(counts)):
+        counts[rng.randrange(len(counts))] += 1
+    return counts
+
+
+def copy_rows(cursor, table, columns, rows):
+    """COPY an iterable of tuples into a table, COPY_CHUNK rows at a time; returns the row count"""
+    sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+    count = 0
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+        if count % COPY_CHUNK == 0:
+            buffer.seek(0)
+            cursor.copy_expert(sql, buffer)
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+    if buffer.tell():
+        buffer.seek(0)
+        cursor.copy_expert(sql, buffer)
+    return count
+
+
+def next_ids(cursor):
+    """First free id of every seeded table with an id column"""
+    ids = {}
+    for table in SEEDED_TABLES[:8]:
+        cursor.execute(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {table}")
+        ids[table] = cursor.fetchone()[0]
+    return ids
+
+
+def backfill_triggers(cursor, first_ids):
+    """Do in one UPDATE per table what the row triggers skipped during COPY"""
+    for table in SEEDED_TABLES[:8]:
+        assignments = []
+        if table in CHANGE_FEED_TABLES:
+            assignments += ["change_seq = nextval('change_seq')", "change_xid = pg_current_xact_id()::text::bigint"]
+        if table in SEARCH_COLUMNS:
+            assignments.append(f"search_vector = {search_vector_sql(table)}")
+        if assignments:
+            cursor.execute(f"UPDATE {table} SET {', '.join(assignments)} WHERE id >= %s", (first_ids[table],))
+
+
+def generate(counts, rng, first_ids, password_hash):
+    """Build every row except images (streamed by generate_images) in memory"""
+    data = {table: [] for table in SEEDED_TABLES}
+    ids = dict(first_ids)
+
+    def new_id(table):
+        ids[table] += 1
+        return ids[table] - 1
+
+    weights = tenant_weights(counts['companies'])
+    events_per_company = split(counts['events'], weights, rng)
+    shots_per_company = split(counts['shot_requests'], weights, rng)
+    images_per_company = split(counts['images'], weights, rng)
+    season_start = date(2025, 1, 1)
+
+    companies = []
+    for n in range(counts['companies']):
+        company_id = new_id('companies')
+        label = f'{rng.choice(WORDS)} {rng.choice(WORDS)} Media {company_id}'
+        data['companies'].append((company_id, label, False))
+        data['users'].append((
+            new_id('users'), f'Admin {company_id}', f'admin@company{company_id}.test',
+            password_hash, 'Admin', 'avatar1.png', company_id,
+        ))
+
+        personnel_ids = []
+        for _ in range(counts['personnel']):
+            personnel_id = new_id('personnels')
+            name = f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+            data['personnels'].append((
+                personnel_id, name, f'crew{personnel_id}@company{company_id}.test',
+                f'555-{rng.randrange(10000):04d}', rng.choice(ROLES), company_id,
+            ))
+            personnel_ids.append(personnel_id)
+
+        project_ids = []
+        for _ in range(counts['organizations']):
+            organization_id = new_id('organizations')
+            data['organizations'].append((organization_id, f'{rng.choice(WORDS)} Group', None, company_id))
+            for _ in range(counts['projects']):
+                project_id = new_id('projects')
+                start = season_start + timedelta(days=rng.randrange(330))
+                data['projects'].append((
+                    project_id, f'{rng.choice(WORDS)} Festival {start.year}', rng.choice(LOCATIONS),
+                    start.isoformat(), (start + timedelta(days=rng.randrange(1, 30))).isoformat(),
+                    (start + timedelta(days=rng.randrange(30, 60))).isoformat(), organization_id,
+                ))
+                for personnel_id in rng.sample(personnel_ids, min(len(personnel_ids), 5)):
+                    data['project_personnel_association'].append((project_id, personnel_id))
+                project_ids.append((project_id, start))
+
+        event_ids = []
+        for _ in range(events_per_company[n]):
+            event_id = new_id('events')
+            project_id, start = rng.choice(project_ids) if project_ids else (None, season_start)
+            day = start + timedelta(days=rng.randrange(30))
+            hour = rng.randrange(8, 21)
+            data['events'].append((
+                event_id, f'{rng.choice(EVENT_KINDS)} {event_id}', day.isoformat(),
+                f'{hour:02d}:00', f'{min(hour + rng.randrange(1, 4), 23):02d}:00', rng.choice(LOCATIONS), None,
+                rng.random() < 0.1, (day + timedelta(days=rng.randrange(1, 8))).isoformat(),
+                rng.choices(PROCESS_POINTS, PROCESS_WEIGHTS)[0], rng.randrange(4), project_id, company_id,
+            ))
+            for personnel_id in rng.sample(personnel_ids, min(len(personnel_ids), rng.randrange(1, 4))):
+                data['personnel_event_association'].append((personnel_id, event_id))
+            event_ids.append(event_id)
+
+        shot_request_ids = []
+        for _ in range(shots_per_company[n]):
+            shot_request_id = new_id('shot_requests')
+            event_id = rng.choice(event_ids) if event_ids else None
+            data['shot_requests'].append((
+                shot_request_id, rng.choice(SHOTS), None, rng.random() < 0.1, None, None, None,
+                rng.choices(PROCESS_POINTS, PROCESS_WEIGHTS)[0], company_id,
+            ))
+            # Links are skipped when an override left nothing to link to (e.g. --events 0)
+            if event_id is not None:
+                data['event_request_association'].append((event_id, shot_request_id))
+            if project_ids:
+                data['project_requests_association'].append((rng.choice(project_ids)[0], shot_request_id))
+            if personnel_ids:
+                data['personnel_shot_request_association'].append((rng.choice(personnel_ids), shot_request_id))
+            shot_request_ids.append(shot_request_id)
+
+        companies.append((company_id, event_ids, shot_request_ids, images_per_company[n]))
+    return data, companies, ids
+
+
+def generate_images(companies, rng, first_id):
+    """Stream image rows; most belong to an event, some to a shot request"""
+    image_id = first_id
+    for company_id, event_ids, shot_request_ids, count in companies:
+        if not event_ids and not shot_request_ids:
+            continue  # Every image belongs to an event or a shot request
+        for _ in range(count):
+            if shot_request_ids and (not event_ids or rng.random() < 0.1):
+                event_id, requests_id = None, rng.choice(shot_request_ids)
+            else:
+                event_id, requests_id = rng.choice(event_ids), None
+            filename = f'IMG_{image_id:08d}.jpg'
+            yield (
+                image_id, filename, f'uploads/{company_id}/{filename}', f'uploads/{company_id}/thumb_{filename}',
+                rng.random() < 0.2, rng.random() < 0.05, '2025-06-01T12:00:00',
+                rng.randrange(2_000_000, 25_000_000), event_id, requests_id, company_id,
+            )
+            image_id += 1
+
+
+COLUMNS = {
+    'companies': ['id', 'name', 'is_super_admin'],
+    'users': ['id', 'name', 'email', 'password_hash', 'access', 'avatar', 'company_id'],
+    'organizations': ['id', 'name', 'details', 'company_id'],
+    'personnels': ['id', 'name', 'email', 'phone', 'role', 'company_id'],
+    'projects': ['id', 'name', 'location', 'start_date', 'end_date', 'deliver_date', 'organization_id'],
+    'events': [
+        'id', 'name', 'date', 'start_time', 'end_time', 'location', 'notes', 'quick_turn', 'deadline',
+        'process_point', 'column_number', 'project_id', 'company_id',
+    ],
+    'shot_requests': [
+        'id', 'request', 'notes', 'quick_turn', 'start_time', 'end_time', 'deadline', 'process_point', 'company_id',
+    ],
+    'images': [
+        'id', 'filename', 'file_path', 'thumbnail_path', 'client_select', 'favorite', 'upload_date',
+        'file_size', 'event_id', 'requests_id', 'company_id',
+    ],
+    'personnel_event_association': ['personnel_id', 'event_id'],
+    'event_request_association': ['event_id', 'shot_request_id'],
+    'project_requests_association': ['project_id', 'shot_request_id'],
+    'project_personnel_association': ['project_id', 'personnel_id'],
+    'personnel_shot_request_association': ['personnel_id', 'shot_request_id'],
+}
+
+
+def reset(engine):
+    """Empty every seeded table and recreate the Relay super admin"""
+    from reset_database import create_relay_super_admin
+
+    with engine.begin() as conn:
+        conn.execute(text(f"TRUNCATE {', '.join(SEEDED_TABLES)} RESTART IDENTITY CASCADE"))
+        if images_partitioned(conn):
+            # Company partitions of the old dataset
+            for (name,) in conn.execute(text(
+                "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                "WHERE i.inhparent = to_regclass('images') AND c.relname LIKE 'images\\_company\\_%'"
+            )):
+                conn.execute(text(f"DROP TABLE {name}"))
+    create_relay_super_admin()
+
+
+def seed(engine, counts, seed_value, password):
+    rng = random.Random(seed_value)
+    # One hash for every seeded admin: hashing thousands of passwords would dominate the run
+    password_hash = generate_password_hash(password)
+
+    # One transaction: COPY goes through the raw psycopg2 cursor of this connection
+    with engine.begin() as conn:
+        cursor = conn.connection.dbapi_connection.cursor()
+        started = time.time()
+        first_ids = next_ids(cursor)
+        data, companies, ids = generate(counts, rng, first_ids, password_hash)
+        print(f"Generated in {time.time() - started:.1f}s")
+
+        # Row triggers (and foreign key checks) off until the end of this transaction
+        cursor.execute("SET LOCAL session_replication_role = replica")
+
+        for table in SEEDED_TABLES:
+            started = time.time()
+            if table == 'images':
+                rows = generate_images(companies, rng, ids['images'])
+            else:
+                rows = data[table]
+            count = copy_rows(cursor, table, COLUMNS[table], rows)
+            print(f"  {table}: {count} rows in {time.time() - started:.1f}s")
+            if table == 'companies' and images_partitioned(conn):
+                # COPY skips the ORM hook that gives new companies their images partition
+                for company_id, *_ in companies:
+                    create_image_partition(conn, company_id)
+
+        started = time.time()
+        backfill_triggers(cursor, first_ids)
+        print(f"  change_seq and search vectors in {time.time() - started:.1f}s")
+
+        for table in SEEDED_TABLES[:8]:
+            cursor.execute(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT MAX(id) FROM {table}))"
+            )
+
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        conn.execute(text(f"ANALYZE {', '.join(SEEDED_TABLES)}"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load a synthetic multi-tenant dataset with COPY')
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--seed', type=int, default=42, help='Same seed and counts give the same dataset')
+    parser.add_argument('--reset', action='store_true', help='Empty the seeded tables first')
+    parser.add_argument('--password', default='password123', help='Password of the seeded company admins')
+    for name, unit in COUNT_UNITS.items():
+        parser.add_argument(f'--{name.replace("_", "-")}', type=int, help=f'Override the number of {name} ({unit})')
+    args = parser.parse_args()
+
+    counts = dict(SCALES[args.scale])
+    for name in counts:
+        if getattr(args, name) is not None:
+            if getattr(args, name) < 0:
+                parser.error(f'--{name.replace("_", "-")} must not be negative')
+            counts[name] = getattr(args, name)
+    if counts['companies'] < 1:
+        parser.error('--companies must be at least 1: every other row belongs to a company')
+
+    engine = init_db()
+    if engine.dialect.name != 'postgresql':
+        parser.error('seed.py loads data with COPY and needs PostgreSQL')
+    with engine.connect() as conn:
+        if conn.execute(text("SELECT current_setting('is_superuser')")).scalar() != 'on':
+            parser.error('seed.py turns off row triggers during COPY and needs a superuser connection')
+
+    if args.reset:
+        reset(engine)
+
+    print(f"Seeding {args.scale} dataset (seed {args.seed}): {counts}")
+    started = time.time()
+    seed(engine, counts, args.seed, args.password)
+    print(f"✅ Seeded in {time.time() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+Slow query log with EXPLAIN capture.
+
+Every statement that takes longer than RELAY_SLOW_QUERY_MS is recorded with
+its parameters, duration and caller (resource class and HTTP method, or the
+thread name for background work). A background thread then explains it on a
+separate connection and the entry, plan included, is kept in an in-memory ring
+buffer and appended as a JSON line to RELAY_SLOW_QUERY_LOG.
+
+Plans come from EXPLAIN (ANALYZE, BUFFERS) for plain SELECTs, which runs the
+query a second time, and from a plain EXPLAIN for everything else so writes
+are never repeated. WITH statements (which can hide data-modifying CTEs),
+SELECT ... INTO or FOR UPDATE, and SELECTs calling functions whose effects
+survive a rollback, such as nextval(), count as everything else. Both run in a
+transaction that is rolled back, under a statement timeout. Only PostgreSQL
+statements are explained.
+
+GET /api/admin/slow-queries lists the worst statements from the ring buffer.
+"""
+
+import json
+import os
+import queue
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from flask import current_app, has_request_context, request
+from sqlalchemy import event
+
+
+# Slow query log configuration
+SLOW_QUERY_CONFIG = {
+    'threshold_ms': float(os.getenv('RELAY_SLOW_QUERY_MS', '0')),  # 0 turns the log off
+    'log_file': os.getenv('RELAY_SLOW_QUERY_LOG', 'slow_queries.log'),
+    'explain': os.getenv('RELAY_SLOW_QUERY_EXPLAIN', '1') == '1',
+    'explain_timeout_ms': 5000,
+    'buffer_size': 500,  # Entries kept in memory for the admin endpoint
+    'queue_size': 100,  # Pending explains; slow queries beyond this are logged without a plan
+    'max_parameters_chars': 500,
+}
+
+# Anything in a SELECT that re-running it under EXPLAIN ANALYZE must not repeat
+_NOT_PLAIN_SELECT = re.compile(
+    r'\b(nextval|setval|pg_notify|pg_advisory\w*|lo_\w+|dblink\w*)\s*\(|\bINTO\b|\bFOR\s+(NO\s+KEY\s+)?(UPDATE|SHARE)\b',
+    re.IGNORECASE,
+)
+
+
+def is_plain_select(statement):
+    """True for a SELECT that is safe to run a second time with EXPLAIN ANALYZE"""
+    words = statement.lstrip().split(None, 1)
+    return bool(words) and words[0].upper() == 'SELECT' and not _NOT_PLAIN_SELECT.search(statement)
+
+# Set on the explain connection so its own statements aren't logged
+_SKIP_OPTION = 'relay_skip_slow_log'
+
+
+class SlowQueryLog:
+    """Ring buffer of slow statements, explained and written out by a worker thread"""
+
+    def __init__(self, engine, config=None):
+        self.engine = engine
+        self.config = dict(SLOW_QUERY_CONFIG, **(config or {}))
+        self.entries = deque(maxlen=self.config['buffer_size'])
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=self.config['queue_size'])
+        self._thread = None
+
+    def start(self):
+        event.listen(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(self.engine, 'after_cursor_execute', self._after_cursor_execute)
+        self._thread = threading.Thread(target=self._run, name='slow-query-log', daemon=True)
+        self._thread.start()
+        return self
+
+    # Capture
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._relay_slow_started = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, '_relay_slow_started', None)
+        if started is None or context.execution_options.get(_SKIP_OPTION):
+            return
+        duration_ms = (time.perf_counter() - started) * 1000
+        if duration_ms < self.config['threshold_ms']:
+            return
+
+        entry = {
+            'time': datetime.utcnow().isoformat(),
+            'duration_ms': round(duration_ms, 1),
+            'statement': statement,
+            'parameters': repr(parameters)[:self.config['max_parameters_chars']],
+            'caller': _caller(),
+            'plan': None,
+        }
+        try:
+            # Statements run by executemany have a list of parameter sets: nothing single to explain
+            self._queue.put_nowait((entry, None if executemany else parameters))
+        except queue.Full:
+            entry['plan_error'] = 'explain queue full'
+            self._store(entry)
+
+    # Worker
+
+    def _run(self):
+        while True:
+            entry, parameters = self._queue.get()
+            try:
+                if self.config['explain'] and parameters is not None:
+                    self._explain(entry, parameters)
+            except Exception as e:
+                entry['plan_error'] = str(e)
+            self._store(entry)
+
+    def _explain(self, entry, parameters):
+        if self.engine.dialect.name != 'postgresql':
+            return
+        statement = entry['statement']
+        explain = 'EXPLAIN (ANALYZE, BUFFERS) ' if is_plain_select(statement) else 'EXPLAIN '
+        with self.engine.connect().execution_options(**{_SKIP_OPTION: True}) as conn:
+            with conn.begin() as transaction:
+                conn.exec_driver_sql(f"SET LOCAL statement_timeout = {int(self.config['explain_timeout_ms'])}")
+                rows = conn.exec_driver_sql(explain + statement, parameters).fetchall()
+                transaction.rollback()
+        entry['plan'] = '\n'.join(row[0] for row in rows)
+
+    def _store(self, entry):
+        with self._lock:
+            self.entries.append(entry)
+        try:
+            with open(self.config['log_file'], 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+        except OSError as e:
+            print(f"Could not write slow query log: {e}")
+
+    # Reporting
+
+    def top(self, limit=20, sort='total_ms'):
+        """Statements in the buffer grouped by SQL text, worst first"""
+        with self._lock:
+            entries = list(self.entries)
+        grouped = {}
+        for entry in entries:
+            stats = grouped.setdefault(entry['statement'], {
+                'statement': entry['statement'],
+                'count': 0,
+                'total_ms': 0.0,
+                'max_ms': 0.0,
+                'callers': set(),
+                'last_seen': None,
+                'plan': None,
+                'parameters': None,
+            })
+            stats['count'] += 1
+            stats['total_ms'] += entry['duration_ms']
+            stats['callers'].add(entry['caller'])
+            stats['last_seen'] = entry['time']
+            if entry['duration_ms'] >= stats['max_ms']:
+                # Keep the plan and parameters of the slowest run
+                stats['max_ms'] = entry['duration_ms']
+                stats['parameters'] = entry['parameters']
+                stats['plan'] = entry.get('plan') or stats['plan']
+
+        offenders = sorted(grouped.values(), key=lambda stats: stats[sort], reverse=True)[:limit]
+        for stats in offenders:
+            stats['total_ms'] = round(stats['total_ms'], 1)
+            stats['mean_ms'] = round(stats['total_ms'] / stats['count'], 1)
+            stats['callers'] = sorted(stats['callers'])
+        return offenders
+
+
+def _caller():
+    """Resource class and method of the current request, or the thread name outside one"""
+    if not has_request_context():
+        return threading.current_thread().name
+    view_class = getattr(current_app.view_functions.get(request.endpoint), 'view_class', None)
+    return f"{view_class.__name__ if view_class else request.endpoint}.{request.method.lower()}"
+
+
+slow_query_log = None
+
+
+def init_slow_query_log(engine):
+    """Start the slow query log when RELAY_SLOW_QUERY_MS is set"""
+    global slow_query_log
+    if SLOW_QUERY_CONFIG['threshold_ms'] > 0 and slow_query_log is None:
+        slow_query_log = SlowQueryLog(engine).start()
+    return slow_query_log
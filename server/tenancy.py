@@ -0,0 +1,135 @@
+"""
+Tenant scoping in the query layer.
+
+Every ORM statement run during a request is restricted to the caller's company
+with a `do_orm_execute` hook and `with_loader_criteria`, so resources no longer
+depend on a company_id query arg to avoid returning every tenant's rows.
+
+The caller's company comes from the signed session token (tokens.py):
+- company users are always scoped to the company in their token; a company_id
+  query arg can only narrow that further, never widen it
+- super admins are unscoped, or scoped to the company_id query arg if given
+- requests without a token are rejected with 401, except on the public
+  routes (login, submitting an access request). RELAY_REQUIRE_TOKEN=0 is an explicit
+  opt-out that restores the legacy unscoped behaviour for anonymous callers
+
+Background work (email sender, migrations) runs outside a request and is never
+scoped. A statement can opt out with execution_options(skip_tenant_scope=True).
+"""
+
+import os
+
+from flask import g, has_request_context, request
+from sqlalchemy import event, false, select
+from sqlalchemy.orm import Session as OrmSession, with_loader_criteria
+
+from models import (
+    Company,
+    User,
+    Organization,
+    Personnel,
+    Project,
+    Events,
+    ShotRequest,
+    Image,
+    ChangeTombstone,
+    set_default_company,
+)
+from tokens import current_claims, request_route
+
+
+# Tenancy configuration
+TENANCY_CONFIG = {
+    'require_token': os.getenv('RELAY_REQUIRE_TOKEN', '1') != '0',
+    # (endpoint, method) pairs reachable without a token
+    'public_routes': {
+        ('userlogin', 'POST'),
+        ('accessrequests', 'POST'),
+        ('home', 'GET'),
+        ('metrics', 'GET'),
+    },
+    # Loaded by <img> or EventSource, so they also accept a URL token as ?token=
+    'url_token_endpoints': {'serve_uploaded_file', 'stream_schedule_board'},
+}
+
+if not TENANCY_CONFIG['require_token']:
+    print("RELAY_REQUIRE_TOKEN=0: requests without a token are not tenant scoped and can read every company's data")
+
+
+def tenant_company_id():
+    """Company the current request is scoped to, or None when unscoped"""
+    if not has_request_context():
+        return None
+    return g.get('tenant_company_id')
+
+
+# New events and shot requests without a project belong to the caller's company
+set_default_company(tenant_company_id)
+
+
+def tenant_criteria(company_id):
+    """Loader criteria restricting each tenant-owned model to one company"""
+    if company_id is None:
+        # A company user without a company sees nothing
+        return [with_loader_criteria(model, false(), include_aliases=True) for model in (
+            Company, User, Organization, Personnel, Project, Events, ShotRequest, Image, ChangeTombstone,
+        )]
+
+    organization_ids = select(Organization.id).where(Organization.company_id == company_id)
+    return [
+        with_loader_criteria(Company, Company.id == company_id, include_aliases=True),
+        with_loader_criteria(User, User.company_id == company_id, include_aliases=True),
+        with_loader_criteria(Organization, Organization.company_id == company_id, include_aliases=True),
+        with_loader_criteria(Personnel, Personnel.company_id == company_id, include_aliases=True),
+        with_loader_criteria(Project, Project.organization_id.in_(organization_ids), include_aliases=True),
+        # Events, shot requests and images carry a denormalized company_id
+        with_loader_criteria(Events, Events.company_id == company_id, include_aliases=True),
+        with_loader_criteria(ShotRequest, ShotRequest.company_id == company_id, include_aliases=True),
+        with_loader_criteria(Image, Image.company_id == company_id, include_aliases=True),
+        # Tombstones of tables without company_id only carry ids and stay visible
+        with_loader_criteria(
+            ChangeTombstone,
+            (ChangeTombstone.company_id == company_id) | ChangeTombstone.company_id.is_(None),
+            include_aliases=True,
+        ),
+    ]
+
+
+@event.listens_for(OrmSession, 'do_orm_execute')
+def _scope_to_tenant(orm_execute_state):
+    if not has_request_context() or not g.get('tenant_scoped'):
+        return
+    if orm_execute_state.execution_options.get('skip_tenant_scope'):
+        return
+    if not (orm_execute_state.is_select or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    orm_execute_state.statement = orm_execute_state.statement.options(
+        *tenant_criteria(g.get('tenant_company_id'))
+    )
+
+
+def init_tenancy(app):
+    """Derive the tenant scope of each request from its token (register after init_token_auth)"""
+
+    @app.before_request
+    def _load_tenant():
+        g.tenant_scoped = False
+        g.tenant_company_id = None
+        claims = current_claims()
+
+        if claims is None:
+            if TENANCY_CONFIG['require_token'] and request_route() not in TENANCY_CONFIG['public_routes'] \
+                    and request.method != 'OPTIONS':
+                return {'error': 'Authentication required'}, 401
+            return None
+
+        if claims.get('sa'):
+            company_id = request.args.get('company_id', type=int)
+            if company_id is not None:
+                g.tenant_scoped = True
+                g.tenant_company_id = company_id
+            return None
+
+        g.tenant_scoped = True
+        g.tenant_company_id = claims.get('cid')
+        return None
@@ -0,0 +1,190 @@
+"""
+Signed session tokens.
+
+Login issues a compact token carrying the user's id, company, access level and
+super admin flag, signed with HMAC-SHA256:
+
+    base64url(json claims) + "." + base64url(hmac(secret, claims part))
+
+Verifying it is a constant-time digest comparison plus an expiry check, so a
+request can be scoped to its user and company without touching the database.
+Logout revokes a token by id; revoked ids are kept in revoked_tokens and
+mirrored in a small in-memory list that each worker refreshes periodically.
+
+<img> tags and EventSource can't send an Authorization header, so a session
+token can be exchanged for a short-lived URL token (scope "url") passed as
+?token= on the few routes that accept one. URL tokens share their session's
+id, so logging out revokes them too, and they are never accepted as Bearer
+tokens.
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+from datetime import datetime, timezone
+
+from flask import g, request
+
+from models import RevokedToken
+
+
+# Token configuration
+TOKEN_CONFIG = {
+    'secret': os.getenv('RELAY_SECRET_KEY', ''),
+    'ttl': int(os.getenv('RELAY_TOKEN_TTL', str(12 * 60 * 60))),  # Seconds
+    'url_ttl': int(os.getenv('RELAY_URL_TOKEN_TTL', '300')),  # Seconds a ?token= URL token stays valid
+    'revocation_refresh': 30,  # Seconds between reloads of the revocation list
+}
+
+if not TOKEN_CONFIG['secret']:
+    print("RELAY_SECRET_KEY not set: using a random key, tokens won't survive a restart or work across workers")
+    TOKEN_CONFIG['secret'] = secrets.token_hex(32)
+
+_SECRET = TOKEN_CONFIG['secret'].encode()
+
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode()
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def _sign(payload):
+    return _b64encode(hmac.new(_SECRET, payload.encode(), hashlib.sha256).digest())
+
+
+def issue_token(user_id, company_id, access, is_super_admin):
+    """Create a signed token and its expiry (unix time)"""
+    now = int(time.time())
+    claims = {
+        'uid': user_id,
+        'cid': company_id,
+        'acc': access,
+        'sa': bool(is_super_admin),
+        'iat': now,
+        'exp': now + TOKEN_CONFIG['ttl'],
+        'jti': secrets.token_urlsafe(12),
+    }
+    return _encode(claims)
+
+
+def issue_url_token(claims):
+    """Short-lived token for ?token= on routes loaded by the browser, derived from a session's claims"""
+    url_claims = dict(claims, scp='url', exp=min(claims['exp'], int(time.time()) + TOKEN_CONFIG['url_ttl']))
+    return _encode(url_claims)
+
+
+def _encode(claims):
+    payload = _b64encode(json.dumps(claims, separators=(',', ':')).encode())
+    return f'{payload}.{_sign(payload)}', claims['exp']
+
+
+def verify_token(token, scope=None):
+    """Claims of a valid, unexpired, unrevoked token of the given scope, otherwise None"""
+    try:
+        payload, signature = token.split('.')
+    except ValueError:
+        return None
+    if not hmac.compare_digest(signature.encode(), _sign(payload).encode()):
+        return None
+    try:
+        claims = json.loads(_b64decode(payload))
+    except ValueError:
+        return None
+    if claims.get('scp') != scope:
+        return None
+    if claims.get('exp', 0) < time.time():
+        return None
+    if revocation_list.is_revoked(claims.get('jti')):
+        return None
+    return claims
+
+
+class RevocationList:
+    """Revoked token ids, cached in memory and reloaded from the database periodically"""
+
+    def __init__(self, refresh_seconds=30):
+        self.refresh_seconds = refresh_seconds
+        self.session_factory = None
+        self._revoked = {}  # jti -> expiry (unix time)
+        self._loaded_at = 0
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        if self.session_factory is None or time.time() - self._loaded_at < self.refresh_seconds:
+            return
+        self._loaded_at = time.time()  # Other threads keep using the current list meanwhile
+        session = self.session_factory()
+        try:
+            now = datetime.utcnow()
+            rows = session.query(RevokedToken.jti, RevokedToken.expires_at).filter(RevokedToken.expires_at > now).all()
+            with self._lock:
+                self._revoked = {
+                    jti: expires_at.replace(tzinfo=timezone.utc).timestamp() for jti, expires_at in rows
+                }
+        except Exception as e:
+            print(f"Failed to refresh token revocation list: {e}")
+        finally:
+            session.close()
+
+    def is_revoked(self, jti):
+        self._refresh()
+        return jti in self._revoked
+
+    def revoke(self, session, claims):
+        """Revoke a token in the caller's transaction and locally right away"""
+        # Expired tokens fail verification anyway, so their rows can go
+        session.query(RevokedToken).filter(RevokedToken.expires_at <= datetime.utcnow()).delete(
+            synchronize_session=False
+        )
+        session.add(RevokedToken(jti=claims['jti'], expires_at=datetime.utcfromtimestamp(claims['exp'])))
+        with self._lock:
+            self._revoked[claims['jti']] = claims['exp']
+
+
+revocation_list = RevocationList(TOKEN_CONFIG['revocation_refresh'])
+
+
+def current_claims():
+    """Claims of the token on the current request, or None for anonymous requests"""
+    return g.get('claims')
+
+
+def request_route():
+    """(endpoint, method) of the current request, with HEAD counted as GET"""
+    return request.endpoint, 'GET' if request.method == 'HEAD' else request.method
+
+
+def init_token_auth(app, session_factory, public_routes=(), url_token_endpoints=()):
+    """Verify Bearer tokens on every request and expose their claims as g.claims
+
+    public_routes are (endpoint, method) pairs; on those an invalid or expired
+    token is treated as no token, so a client holding a stale token can still
+    log in or request access. url_token_endpoints also accept a URL token as
+    ?token= when no Authorization header is sent.
+    """
+    revocation_list.session_factory = session_factory
+
+    @app.before_request
+    def _load_claims():
+        g.claims = None
+        header = request.headers.get('Authorization', '')
+        if header.startswith('Bearer '):
+            claims = verify_token(header[len('Bearer '):].strip())
+        elif request.endpoint in url_token_endpoints and request.args.get('token'):
+            claims = verify_token(request.args['token'], scope='url')
+        else:
+            return None
+        if claims is None:
+            if request_route() in public_routes:
+                return None
+            return {'error': 'Invalid or expired token'}, 401
+        g.claims = claims
+        return None